@@ -0,0 +1,68 @@
+"""Compare the html backends on the same exports.
+
+Usage:
+    python benchmarks/backends.py export.mht [export.mht ...]
+
+For every backend the page is parsed, the images are rewritten and every
+row is rendered, the same work `Parser.rows` does. Prints rows per second.
+"""
+import os
+import sys
+import time
+
+# The add-on's modules import each other by their short names.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'onenote_importer'))
+
+import backends
+import mht
+from emaildata.text import Text
+
+REPEAT = 3
+
+
+def load(path):
+    with open(path, 'rb') as file_:
+        for part in mht.iter_parts(file_):
+            if part.content_type == 'text/html':
+                return Text.to_utf8(part.read(), part.charset)
+
+
+def render(backend, html):
+    document = backend(html)
+    for img in document.images():
+        document.set(img, 'src', 'image.png')
+        document.set(img, 'width', 'auto')
+        document.set(img, 'height', 'auto')
+    rows = 0
+    for table in document.tables():
+        for row in document.rows(table):
+            for cell in document.cells(row, limit=2):
+                document.render(cell)
+            rows += 1
+    return rows
+
+
+def main(paths):
+    pages = [load(path) for path in paths]
+    print('%-15s %10s %10s %12s' % ('backend', 'rows', 'seconds', 'rows/s'))
+    for name, backend in backends.BACKENDS.items():
+        try:
+            backend('<html></html>')
+        except ImportError:
+            print('%-15s not installed' % name)
+            continue
+        best = None
+        for _ in range(REPEAT):
+            start = time.time()
+            rows = sum(render(backend, html) for html in pages)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print('%-15s %10d %10.3f %12.0f' % (
+            name, rows, best, rows / best if best else 0))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    main(sys.argv[1:])
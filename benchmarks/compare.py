@@ -0,0 +1,50 @@
+"""Compare two JSON results of `stages.py` and flag regressions.
+
+Usage:
+    python benchmarks/compare.py old.json new.json [--threshold 0.1]
+
+Exits with status 1 when a stage got slower by more than the threshold,
+10% by default, so it can be used in CI.
+"""
+import argparse
+import json
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.old) as file_:
+        old = json.load(file_)
+    with open(args.new) as file_:
+        new = json.load(file_)
+    if old['options'] != new['options']:
+        sys.stderr.write('Warning: the runs used different options.\n')
+
+    before = dict((stage['stage'], stage) for stage in old['stages'])
+    regressed = False
+    print('%-20s %10s %10s %8s' % ('stage', 'old', 'new', 'change'))
+    for stage in new['stages']:
+        previous = before.get(stage['stage'])
+        if previous is None:
+            print('%-20s %10s %10.3f %8s' % (
+                stage['stage'], '-', stage['seconds'], 'new'))
+            continue
+        change = (stage['seconds'] - previous['seconds']) / \
+            max(previous['seconds'], 1e-9)
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print('%-20s %10.3f %10.3f %+7.0f%%%s' % (
+            stage['stage'], previous['seconds'], stage['seconds'],
+            change * 100, flag))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
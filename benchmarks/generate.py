@@ -0,0 +1,142 @@
+"""Generate synthetic OneNote style .mht exports for benchmarking.
+
+Usage:
+    python benchmarks/generate.py out.mht [--rows N] [--images N] ...
+
+The export mimics what OneNote writes: a multipart/related message with the
+page as quoted-printable (or base64) html, one part per image and a
+filelist.xml part. Every row is a question/answer pair; images are spread
+over the rows and can be nested tables deep inside the question cell.
+"""
+import argparse
+import binascii
+import quopri
+import random
+import struct
+
+BOUNDARY = '----=_NextPart_01D3D7A2.7C0E2E50'
+ROOT = 'file:///C:/Users/bench/AppData/Local/Temp/OneNote/page'
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+
+def add_arguments(parser):
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--cell-size', type=int, default=200,
+                        help='approximate bytes of html per cell')
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--image-size', type=int, default=100000,
+                        help='bytes per image')
+    parser.add_argument('--nested', type=int, default=0,
+                        help='depth of tables nested in the question cell')
+    parser.add_argument('--encoding', default='quoted-printable',
+                        choices=['quoted-printable', 'base64'],
+                        help='transfer encoding of the html part')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def generate(file_, rows=1000, cell_size=200, images=20, image_size=100000,
+             nested=0, encoding='quoted-printable', seed=0):
+    """Write a synthetic export to `file_`. Returns the number of bytes."""
+    rand = random.Random(seed)
+    start = file_.tell()
+    file_.write(
+        'MIME-Version: 1.0\r\n'
+        'Content-Type: multipart/related; boundary="%s"\r\n\r\n'
+        'This document is a Single File Web Page, also known as a Web '
+        'Archive file.\r\n\r\n' % BOUNDARY)
+
+    html = page(rand, rows, cell_size, images, nested)
+    if encoding == 'base64':
+        body = encode_base64(html)
+    else:
+        body = quopri.encodestring(html).replace('\n', '\r\n')
+    write_part(file_, ROOT + '.htm', 'text/html; charset="utf-8"', encoding,
+               body)
+
+    for index in range(images):
+        write_part(file_, '%s_files/image%03d.png' % (ROOT, index),
+                   'image/png', 'base64',
+                   encode_base64(fake_png(rand, image_size)))
+
+    write_part(file_, ROOT + '_files/filelist.xml',
+               'text/xml; charset="utf-8"', 'quoted-printable',
+               '<xml xmlns:o=3D"urn:schemas-microsoft-com:office:office">'
+               '\r\n</xml>')
+    file_.write('--%s--\r\n' % BOUNDARY)
+    return file_.tell() - start
+
+
+def page(rand, rows, cell_size, images, nested):
+    html = ['<html><head><meta http-equiv="Content-Type" '
+            'content="text/html; charset=utf-8"></head><body>'
+            '<p>Synthetic export</p>'
+            '<table border=1 cellpadding=0 cellspacing=0>']
+    for index in range(rows):
+        question = cell(rand, cell_size)
+        if images:
+            question += '<img src="page_files/image%03d.png" width=320 ' \
+                        'height=240>' % (index % images)
+        for _ in range(nested):
+            question = '<table><tr><td>%s</td><td>%s</td></tr></table>' % (
+                question, cell(rand, cell_size // 4))
+        html.append('<tr><td>%s</td><td>%s</td></tr>\n' % (
+            question, cell(rand, cell_size)))
+    html.append('</table></body></html>')
+    return ''.join(html)
+
+
+def cell(rand, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rand.choice(WORDS)
+        if rand.random() < 0.1:
+            word = '<b>%s</b>' % word
+        elif rand.random() < 0.05:
+            word = '%s \xc3\xa9&amp;' % word
+        words.append(word)
+        length += len(word) + 1
+    return '<p style="margin:0in;font-family:Calibri">%s</p>' % ' '.join(words)
+
+
+def fake_png(rand, size):
+    # Only the signature makes it look like a png; the rest is noise so it
+    # does not compress.
+    header = '\x89PNG\r\n\x1a\n'
+    noise = ''.join(struct.pack('<I', rand.getrandbits(32))
+                    for _ in range(max(size - len(header), 0) // 4 + 1))
+    return (header + noise)[:size]
+
+
+def encode_base64(data):
+    # 57 bytes encode to one 76 character line.
+    return ''.join(binascii.b2a_base64(data[index:index + 57])
+                   for index in range(0, len(data), 57)).replace('\n', '\r\n')
+
+
+def write_part(file_, location, content_type, encoding, body):
+    file_.write(
+        '--%s\r\n'
+        'Content-Location: %s\r\n'
+        'Content-Transfer-Encoding: %s\r\n'
+        'Content-Type: %s\r\n\r\n' % (BOUNDARY, location, encoding,
+                                      content_type))
+    file_.write(body)
+    if not body.endswith('\r\n'):
+        file_.write('\r\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output')
+    add_arguments(parser)
+    args = vars(parser.parse_args())
+    output = args.pop('output')
+    with open(output, 'wb') as file_:
+        size = generate(file_, **args)
+    print('Wrote %s, %d bytes' % (output, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Time and memory profile every stage of `Parser` on a synthetic export.
+
+Usage:
+    python benchmarks/stages.py [--rows N] [--images N] ... [--json out.json]
+
+Generates an export with `generate.py`'s options, then runs the stages the
+parser goes through one by one: MIME parse, attachment extraction, html
+parse, image rewrite and row rendering. The streaming MIME reader is timed
+as well. Results are printed as a table and can be written as JSON so runs
+can be compared with `compare.py`.
+
+Memory is that of each stage on its own: the peak resident memory while it
+ran and how far that is above what was resident before it. On Linux the
+kernel's peak is reset before every stage. Elsewhere the process' peak can
+only be read, so a stage that stays below an earlier stage's peak shows no
+number.
+"""
+import argparse
+import email
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The add-on's modules import each other by their short names.
+sys.path.insert(0, os.path.join(HERE, '..', 'onenote_importer'))
+
+import backends
+import mht
+from emaildata.attachment import Attachment
+from emaildata.text import Text
+from generate import add_arguments, generate
+
+
+class Stages(object):
+    def __init__(self, repeat=1):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, name, function, *args):
+        # The fastest of `repeat` runs is the least disturbed by whatever
+        # else the machine is doing.
+        seconds = None
+        before = rss_kb()
+        peak_before = reset_peak_rss()
+        for _ in range(self.repeat):
+            start = time.time()
+            result = function(*args)
+            elapsed = time.time() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+        peak = peak_rss_kb()
+        if peak is not None and peak_before is not None and \
+                peak <= peak_before:
+            # The peak was reached by an earlier stage.
+            peak = None
+        self.results.append({
+            'stage': name,
+            'seconds': seconds,
+            'rss_kb': rss_kb(),
+            'peak_rss_kb': peak,
+            'growth_kb': None if peak is None or before is None
+            else peak - before,
+        })
+        return result
+
+
+def rss_kb():
+    """Current resident memory, where the platform tells."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except IOError:
+        return None
+
+
+def reset_peak_rss():
+    """Start measuring the peak resident memory afresh.
+
+    Returns `None` when it was reset, which only Linux can do, or else the
+    peak so far, as `peak_rss_kb` will keep reporting it.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return None
+    except IOError:
+        return peak_rss_kb()
+
+
+def peak_rss_kb():
+    """Peak resident memory since `reset_peak_rss`, or of the process."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes everywhere else.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def mime_parse(path):
+    with open(path) as file_:
+        return email.message_from_file(file_)
+
+
+def mime_stream(path):
+    with open(path, 'rb') as file_:
+        for part in mht.iter_parts(file_):
+            with open(os.devnull, 'wb') as null:
+                part.copy_to(null)
+
+
+def extract(message):
+    return sum(len(content) for content, filename, mimetype, part
+               in Attachment.extract(message, False))
+
+
+def rewrite_images(document):
+    for img in document.images():
+        document.set(img, 'src', 'image.png')
+        document.set(img, 'width', 'auto')
+        document.set(img, 'height', 'auto')
+
+
+def render_rows(document):
+    rows = 0
+    for table in document.tables():
+        for row in document.rows(table):
+            for cell in document.cells(row, limit=2):
+                document.render(cell).replace('\n', '').replace('\r', '')
+            rows += 1
+    return rows
+
+
+def version():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=HERE).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--backend', default=None,
+                        choices=list(backends.BACKENDS))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='run every stage this many times, keep the best')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+    options = vars(args).copy()
+    backend = backends.get(options.pop('backend'))
+    output = options.pop('json')
+    repeat = options.pop('repeat')
+
+    handle, path = tempfile.mkstemp(suffix='.mht')
+    try:
+        with os.fdopen(handle, 'wb') as file_:
+            size = generate(file_, **options)
+
+        stages = Stages(repeat)
+        stages.run('mime_stream', mime_stream, path)
+        message = stages.run('mime_parse', mime_parse, path)
+        stages.run('attachment_extract', extract, message)
+        html = stages.run('html_decode', lambda: Text.html(message)[0])
+        document = stages.run('html_parse', backend, html)
+        stages.run('img_rewrite', rewrite_images, document)
+        rows = stages.run('row_render', render_rows, document)
+    finally:
+        os.remove(path)
+
+    report = {
+        'version': version(),
+        'python': platform.python_version(),
+        'backend': backend.name,
+        'options': options,
+        'repeat': repeat,
+        'file_bytes': size,
+        'rows': rows,
+        'stages': stages.results,
+    }
+    print('%-20s %10s %12s %12s %12s' % ('stage', 'seconds', 'rss_kb',
+                                          'peak_rss_kb', 'growth_kb'))
+    for stage in stages.results:
+        print('%-20s %10.3f %12s %12s %12s' % (
+            stage['stage'], stage['seconds'], stage['rss_kb'],
+            '-' if stage['peak_rss_kb'] is None else stage['peak_rss_kb'],
+            '-' if stage['growth_kb'] is None else stage['growth_kb']))
+    if output:
+        with open(output, 'w') as file_:
+            json.dump(report, file_, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
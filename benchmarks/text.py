@@ -0,0 +1,181 @@
+"""Count the copies of the page's text on its way to Anki's notes.
+
+Usage:
+    python benchmarks/text.py [--rows N] [--cell-size N] ... [--newlines]
+
+Text stays utf-8 encoded from the decoded page to the rows and is decoded
+once, when the notes are made. This runs the decoded page of a synthetic
+export through the add-on's original text handling and through the current
+one, and prints the copies of text each makes, the bytes they hold and the
+time taken:
+
+- original: the page is decoded and encoded back to utf-8, BeautifulSoup
+  turns it into unicode, every cell is encoded again and has its line
+  breaks replaced, the rows are joined into one tab separated string and
+  Anki's text importer decodes that again.
+- current: the utf-8 page goes to the backend as it is, line breaks are
+  only replaced in cells that have them, and every cell is decoded once.
+
+A step that returns its input unchanged makes no copy. Copies made inside
+the html libraries are not counted, except BeautifulSoup's decoding of the
+whole page. `--newlines` adds a line break to every cell, as OneNote's html
+often has them, and `--also-strip` times alternatives for stripping them.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# The add-on's modules import each other by their short names.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'onenote_importer'))
+
+import backends
+import mht
+from emaildata.text import Text
+from generate import add_arguments, generate
+
+# Bytes per character of a unicode string in this Python build.
+UNICODE_WIDTH = 4 if sys.maxunicode > 0xffff else 2
+
+
+class Copies(object):
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+
+    def add(self, result, source=None):
+        """Count `result` as a copy unless it is `source` itself."""
+        if result is not source:
+            self.record(result)
+        return result
+
+    def record(self, text):
+        self.count += 1
+        self.bytes += len(text) * (
+            UNICODE_WIDTH if isinstance(text, unicode) else 1)
+
+
+def strip(copies, text):
+    stripped = copies.add(text.replace('\n', ''), text)
+    return copies.add(stripped.replace('\r', ''), stripped)
+
+
+def original(html, charset, newlines):
+    from BeautifulSoup import BeautifulSoup
+    copies = Copies()
+    page = copies.add(html.decode(charset or 'utf-8').encode('utf-8'))
+    soup = BeautifulSoup(page, fromEncoding='utf-8')
+    copies.record(page.decode('utf-8'))
+    lines = []
+    for table in soup.findAll('table'):
+        for row in table.findAll('tr', recursive=False):
+            tds = row.findAll(recursive=False, limit=2)
+            question, answer = [
+                strip(copies, copies.add(td.renderContents() + newlines))
+                for td in tds]
+            lines.append(copies.add('%s\t%s\n' % (question, answer)))
+    output = copies.add(''.join(lines))
+    text = copies.add(output.decode('utf-8'))
+    notes = [line.split('\t') for line in text.splitlines()]
+    for note in notes:
+        for field in note:
+            copies.record(field)
+    return len(notes), copies
+
+
+def current(html, charset, newlines, backend):
+    copies = Copies()
+    page = copies.add(Text.to_utf8(html, charset), html)
+    document = backend(page)
+    notes = 0
+    for table in document.tables():
+        for row in document.rows(table):
+            for cell in document.cells(row, limit=2):
+                rendered = copies.add(document.render(cell) + newlines)
+                copies.add(unicode(strip(copies, rendered), 'utf-8'))
+            notes += 1
+    return notes, copies
+
+
+def best_of(repeat, function, *args):
+    seconds = None
+    for _ in range(repeat):
+        start = time.time()
+        result = function(*args)
+        elapsed = time.time() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return result, seconds
+
+
+def compare_strips(html, charset, backend, newlines, repeat):
+    document = backend(Text.to_utf8(html, charset))
+    cells = [document.render(cell) + newlines
+             for table in document.tables()
+             for row in document.rows(table)
+             for cell in document.cells(row, limit=2)]
+    strips = [
+        ('replace', lambda text: text.replace('\n', '').replace('\r', '')),
+        ('translate', lambda text: text.translate(None, '\r\n')),
+    ]
+    print('')
+    print('%-15s %10s' % ('strip', 'seconds'))
+    for name, function in strips:
+        result, seconds = best_of(repeat, map, function, cells)
+        print('%-15s %10.3f' % (name, seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--backend', default=None,
+                        choices=list(backends.BACKENDS),
+                        help='backend of the current pipeline')
+    parser.add_argument('--newlines', action='store_true',
+                        help='add a line break to every cell')
+    parser.add_argument('--also-strip', action='store_true',
+                        help='time ways of stripping line breaks too')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='run every pipeline this many times, keep the '
+                             'best')
+    args = parser.parse_args()
+    options = vars(args).copy()
+    backend = backends.get(options.pop('backend'))
+    repeat = options.pop('repeat')
+    newlines = '\r\n' if options.pop('newlines') else ''
+    also_strip = options.pop('also_strip')
+
+    handle, path = tempfile.mkstemp(suffix='.mht')
+    try:
+        with os.fdopen(handle, 'wb') as file_:
+            generate(file_, **options)
+        with open(path, 'rb') as file_:
+            for part in mht.iter_parts(file_):
+                if part.content_type == 'text/html':
+                    html, charset = part.read(), part.charset
+                    break
+    finally:
+        os.remove(path)
+
+    print('%.1f MB page' % (len(html) / 1e6))
+    print('%-25s %8s %8s %12s %10s' % ('pipeline', 'notes', 'copies',
+                                       'MB copied', 'seconds'))
+    pipelines = [('original (beautifulsoup)', original, ()),
+                 ('current (%s)' % backend.name, current, (backend,))]
+    for name, function, extra in pipelines:
+        try:
+            (notes, copies), seconds = best_of(
+                repeat, function, html, charset, newlines, *extra)
+        except ImportError:
+            print('%-25s not installed' % name)
+            continue
+        print('%-25s %8d %8d %12.1f %10.3f' % (
+            name, notes, copies.count, copies.bytes / 1e6, seconds))
+
+    if also_strip:
+        compare_strips(html, charset, backend, newlines, repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,532 @@
+import os
+import shutil
+import sys
+import threading
+from glob import glob
+from tempfile import mkdtemp
+
+import aqt
+from anki.hooks import addHook
+from aqt import mw
+from aqt.qt import *
+from aqt.utils import showText, tooltip
+
+import ui
+from batch import merge_media, parse_files
+from cache import ResultCache
+from census import scan_files
+from importer import MHTImporter
+from optimize import Optimizer
+from progress import Cancelled, Progress
+from stats import Stats
+from store import RowStore
+import media
+import sources
+import watch
+from config import (
+    BACKEND, CACHE_DIR, CACHE_SIZE, INCREMENTAL, JPEG_QUALITY, LINK_MEDIA,
+    LOSSY_IMAGES, MAX_IMAGE_DIMENSION, MEMORY_BUDGET, NESTED_TABLES,
+    OPTIMIZE_IMAGES, REFERENCED_MEDIA_ONLY, STAGING_PREFIX, STATS_JSON,
+    STREAMING, WATCH_DECK, WATCH_FOLDER, WATCH_INTERVAL, WATCH_SETTLE)
+
+
+class MHTImportDialog(QDialog):
+    """Asks for the deck, and which tables to import out of a census of the
+    files.
+
+    Once accepted, `deckId` is the chosen deck and `selected` a set of table
+    indexes per file of the census. Both stay `None` when cancelled.
+    """
+
+    def __init__(self, mw, census):
+        QDialog.__init__(self, mw, Qt.Window)
+        self.mw = mw
+        self.census = census
+        self.selected = None
+        self.deckId = None
+        self.items = []
+        self.frm = ui.Ui_MHTImportDialog()
+        self.frm.setupUi(self)
+
+        b = QPushButton(_("Import"))
+        self.frm.buttonBox.addButton(b, QDialogButtonBox.AcceptRole)
+
+        self.deck = aqt.deckchooser.DeckChooser(
+            self.mw, self.frm.deckArea, label=False)
+        self.showCensus()
+
+        self.exec_()
+
+    def showCensus(self):
+        many = len(self.census) > 1
+        shown = []
+        for file_index, (source, file_tables) in enumerate(self.census):
+            for table in file_tables:
+                # Nested tables are part of their parent's cards unless
+                # they become cards of their own.
+                if table.nested and NESTED_TABLES != 'separate':
+                    continue
+                shown.append(table)
+                text = _("Table %(index)d: %(rows)d rows, %(columns)d "
+                         "columns, %(images)d images") % dict(
+                    index=table.index + 1, rows=table.cards,
+                    columns=table.columns, images=table.images)
+                if table.cards < table.rows:
+                    # Rows need a front and a back side.
+                    text += _(", %d rows without a back side skipped") % (
+                        table.rows - table.cards)
+                if many:
+                    text = os.path.basename(source) + " - " + text
+                item = QListWidgetItem(text, self.frm.tablesList)
+                if table.importable:
+                    item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                    item.setCheckState(Qt.Checked)
+                else:
+                    # Rows need a front and a back side.
+                    item.setFlags(item.flags() & ~Qt.ItemIsEnabled)
+                self.items.append((file_index, table.index, item))
+
+        self.frm.censusLabel.setText(
+            _("%(tables)d tables with %(rows)d rows and %(images)d images "
+              "in %(files)d files.") % dict(
+                tables=len(shown), rows=sum(t.cards for t in shown),
+                images=sum(t.images for t in shown),
+                files=len(self.census)))
+
+    def accept(self):
+        self.selected = [set() for _source in self.census]
+        for file_index, table_index, item in self.items:
+            if item.checkState() == Qt.Checked:
+                self.selected[file_index].add(table_index)
+        self.deckId = self.deck.selectedId()
+        QDialog.accept(self)
+
+
+def importMHT():
+    # Ask for the .mht files, or zipped exports.
+    key = "dir_import_mht"
+    file_paths = QFileDialog.getOpenFileNames(
+        mw, _("Import mht files"), mw.pm.profile.get(key, ""),
+        _("OneNote exports (*.mht *.zip)"))
+    if not file_paths:
+        return
+    mw.pm.profile[key] = os.path.dirname(unicode(file_paths[0]))
+    importFiles([unicode(file_path) for file_path in file_paths])
+
+
+def importMHTFolder():
+    # Ask for a folder and import every .mht file in it. A folder without
+    # any is imported as an unpacked export, if it has a page.
+    key = "dir_import_mht"
+    directory = QFileDialog.getExistingDirectory(
+        mw, _("Import mht folder"), mw.pm.profile.get(key, ""))
+    if not directory:
+        return
+    directory = unicode(directory)
+    mw.pm.profile[key] = directory
+    file_paths = sorted(glob(os.path.join(directory, "*.mht")))
+    if not file_paths and (glob(os.path.join(directory, "*.htm")) or
+                           glob(os.path.join(directory, "*.html"))):
+        file_paths = [directory]
+    if not file_paths:
+        showText(_("No .mht files found in %s") % directory)
+        return
+    importFiles(file_paths)
+
+
+def importFiles(file_paths):
+    stats = Stats()
+
+    # Count the tables first, which only reads the page, and let the user
+    # pick which ones to import. Files counted before are not read again.
+    census_cache = None
+    if CACHE_DIR:
+        census_cache = ResultCache(
+            os.path.join(CACHE_DIR, "results"), CACHE_SIZE,
+            settings=repr(BACKEND))
+    try:
+        with stats.timer('census'):
+            census = runInBackground(
+                _("Scanning %d files...") % len(file_paths), len(file_paths),
+                lambda progress: scan_files(
+                    file_paths, BACKEND, progress, MEMORY_BUDGET,
+                    census_cache))
+    except Cancelled:
+        return
+    dialog = MHTImportDialog(mw, census)
+    if dialog.selected is None:
+        return
+    selected = [file_path for file_path, tables
+                in zip(file_paths, dialog.selected) if tables]
+    tables = [tables for tables in dialog.selected if tables]
+    if not selected:
+        showText(_("No tables selected."))
+        return
+
+    # Convert mht. Images are staged until the import is accepted, in a
+    # hidden folder next to collection.media, so they can be renamed into it
+    # rather than copied.
+    temp_dir = makeStagingDir()
+    store = None
+    try:
+        total = sum(sources.size(file_path) for file_path in selected)
+        try:
+            with stats.timer('parse_wall'):
+                results = runInBackground(
+                    _("Reading %d files...") % len(selected), total,
+                    lambda progress: parseFiles(
+                        selected, temp_dir, progress, tables))
+        except Cancelled:
+            return
+
+        file_map = merge_media(results)
+        if INCREMENTAL:
+            store = RowStore(
+                os.path.join(mw.pm.profileFolder(), "onenote_importer.db"))
+
+        rows = []
+        for source, file_rows, parsed_map, file_stats in results:
+            stats.merge(file_stats)
+            if store:
+                file_rows = store.filter(source, file_rows)
+            rows.extend(file_rows)
+
+        # import into the collection
+        importer = MHTImporter(mw.col, rows)
+        importer.allowHTML = True
+        importer.initMapping()
+        importNotes(importer, dialog.deckId, file_map, stats, store)
+    finally:
+        # Whatever was not imported is removed.
+        removeStagingDir(temp_dir)
+        if store:
+            store.close()
+
+
+def makeStagingDir():
+    # Staging folders left behind by a crash are removed first, but not
+    # those of an import that is still running.
+    for stale_dir in glob(os.path.join(
+            mw.pm.profileFolder(), STAGING_PREFIX + "*")):
+        if stale_dir not in stagingDirs:
+            shutil.rmtree(stale_dir, ignore_errors=True)
+    temp_dir = mkdtemp(prefix=STAGING_PREFIX, dir=mw.pm.profileFolder())
+    stagingDirs.add(temp_dir)
+    return temp_dir
+
+
+def removeStagingDir(temp_dir):
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    stagingDirs.discard(temp_dir)
+
+
+stagingDirs = set()
+
+
+def parseFiles(file_paths, temp_dir, progress=None, tables=None):
+    """Parse the files with the add-on's settings, see `batch.parse_files`.
+    Can be run outside of the main thread."""
+    media_dir = os.path.join(mw.pm.profileFolder(), "collection.media")
+    optimizer = None
+    if OPTIMIZE_IMAGES:
+        optimizer = Optimizer(
+            max_dimension=MAX_IMAGE_DIMENSION, lossy=LOSSY_IMAGES,
+            quality=JPEG_QUALITY, cache_path=os.path.join(
+                mw.pm.profileFolder(), "onenote_importer.db"))
+    cache = None
+    if CACHE_DIR:
+        # Results depend on everything that changes how files are parsed.
+        cache = ResultCache(
+            os.path.join(CACHE_DIR, "results"), CACHE_SIZE,
+            settings=repr((BACKEND, REFERENCED_MEDIA_ONLY, NESTED_TABLES,
+                           optimizer and optimizer.settings)))
+    # Files are parsed one after the other inside Anki. Worker processes
+    # would start Anki itself again on Windows, where it is a frozen
+    # executable, and be forked from a thread of the Qt process elsewhere.
+    return parse_files(
+        file_paths, progress=progress, processes=1,
+        cache=cache, tables=tables,
+        streaming=STREAMING, media_dir=media_dir,
+        backend=BACKEND, temp_dir=temp_dir,
+        optimizer=optimizer,
+        referenced_only=REFERENCED_MEDIA_ONLY,
+        nested_tables=NESTED_TABLES,
+        memory_budget=MEMORY_BUDGET, link_media=LINK_MEDIA,
+        index_dir=CACHE_DIR and os.path.join(CACHE_DIR, "index"))
+
+
+def importNotes(importer, did, file_map, stats, store=None):
+    # Incremental imports update the notes of edited rows.
+    importer.importMode = 0 if store else 1
+    mw.pm.profile['importMode'] = importer.importMode
+
+    importer.allowHTML = True
+    mw.pm.profile['allowHTML'] = importer.allowHTML
+
+    if did != importer.model['did']:
+        importer.model['did'] = did
+        mw.col.models.save(importer.model)
+    mw.col.decks.select(did)
+
+    # Move the staged media into collection.media. If this is cancelled the
+    # media moved so far is removed again.
+    media_dir = os.path.join(mw.pm.profileFolder(), "collection.media")
+    stats.count('images_committed', sum(
+        1 for meta in file_map.values() if meta.get('path')))
+    try:
+        with stats.timer('media_commit'):
+            runInBackground(
+                _("Copying media..."), len(file_map),
+                lambda progress: media.commit(
+                    file_map, media_dir,
+                    lambda done: progress.update(done=done)))
+    except Cancelled:
+        return
+
+    addNotes(importer, stats, store)
+    txt = _("Importing complete.") + "\n"
+    if importer.log:
+        txt += "\n".join(importer.log)
+    if store and store.skipped:
+        txt += "\n" + _("%d unchanged rows skipped.") % store.skipped
+    txt += "\n\n" + stats.summary()
+    if STATS_JSON:
+        stats.dump(STATS_JSON)
+        txt += "\n" + _("Statistics written to %s") % STATS_JSON
+    showText(txt)
+    mw.reset()
+
+
+def addNotes(importer, stats, store=None):
+    # Notes are created here, as Anki's collection may only be used from the
+    # main thread.
+    rows = len(importer.rows)
+    mw.progress.start(max=rows, immediate=True)
+    mw.checkpoint(_("Import"))
+
+    importer.progress = lambda count: mw.progress.update(
+        _("Adding notes... %(count)d of %(rows)d") % dict(
+            count=count, rows=rows), count)
+    try:
+        with stats.timer('note_import'):
+            importer.run()
+        if store:
+            store.commit()
+    finally:
+        mw.progress.finish()
+
+
+def runInBackground(label, total, task):
+    """Run `task(progress)` in a thread while showing its progress.
+
+    The GUI stays responsive, and the user can cancel, in which case
+    `progress.Cancelled` is raised here once the task has cleaned up.
+    Returns what `task` returned, or raises what it raised.
+    """
+    progress = Progress(total)
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = task(progress)
+        except Exception:
+            outcome['error'] = sys.exc_info()[1]
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+    dialog = QProgressDialog(label, _("Cancel"), 0, 1000, mw)
+    dialog.setWindowModality(Qt.WindowModal)
+    dialog.setMinimumDuration(500)
+    while thread.is_alive():
+        if dialog.wasCanceled():
+            progress.cancel()
+        else:
+            dialog.setValue(int(progress.fraction() * 1000))
+            dialog.setLabelText(describeProgress(label, progress))
+        mw.app.processEvents()
+        thread.join(0.05)
+    dialog.close()
+
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def describeProgress(label, progress):
+    lines = [label]
+    if progress.rows:
+        lines.append(_("%d rows") % progress.rows)
+    eta = progress.eta()
+    if eta is not None:
+        lines.append(_("About %d:%02d left") % divmod(int(eta), 60))
+    return "\n".join(lines)
+
+
+class WatchService(object):
+    """Imports the .mht files saved in `directory` into the deck named
+    `deck_name`, see WATCH_FOLDER.
+
+    A timer looks for changed files, see `watch.Watcher`, and hands them to
+    a thread to be parsed while Anki is used as usual. Their media is moved
+    into collection.media and notes are added on the main thread afterwards,
+    when no other import or dialog is busy.
+    Files are only parsed again when their size or mtime changed, and only
+    their new and edited rows are imported.
+    """
+
+    # Key of the profile under which the imported files' sizes and mtimes
+    # are remembered.
+    KNOWN_KEY = "onenote_watch_known"
+
+    # Seconds `stop` waits for a cancelled job to finish.
+    STOP_TIMEOUT = 2
+
+    def __init__(self, directory, deck_name, interval=WATCH_INTERVAL,
+                 settle=WATCH_SETTLE):
+        self.deck_name = deck_name
+        self.watcher = watch.Watcher(
+            directory, settle=settle,
+            known=mw.pm.profile.setdefault(self.KNOWN_KEY, {}))
+        self.queue = []
+        # The files being parsed, their staging folder, the thread and what
+        # it returned or raised.
+        self.job = None
+        self.timer = QTimer(mw)
+        mw.connect(self.timer, SIGNAL("timeout()"), self.tick)
+        self.timer.start(int(interval * 1000))
+
+    def stop(self):
+        self.timer.stop()
+        self.watcher.close()
+        if self.job:
+            # The job stops at the next file part or row it reads. If that
+            # takes longer it is left to finish in its daemon thread, where
+            # it only cleans up.
+            self.job['progress'].cancel()
+            self.job['thread'].join(self.STOP_TIMEOUT)
+            removeStagingDir(self.job['temp_dir'])
+            self.job = None
+
+    def tick(self):
+        for path in self.watcher.poll():
+            if path not in self.queue:
+                self.queue.append(path)
+        if self.job:
+            if self.job['thread'].is_alive() or not self.idle():
+                return
+            self.finish()
+        if self.queue and self.idle():
+            self.start()
+
+    def idle(self):
+        # The collection is only changed while the user is not in the middle
+        # of something else, e.g. a manual import.
+        own = set([self.job['temp_dir']]) if self.job else set()
+        return bool(mw.col) and not mw.progress.busy() and \
+            mw.app.activeModalWidget() is None and \
+            not stagingDirs - own
+
+    def start(self):
+        file_paths, self.queue = self.queue, []
+        temp_dir = makeStagingDir()
+        progress = Progress(sum(sources.size(file_path)
+                                for file_path in file_paths))
+        job = dict(file_paths=file_paths, temp_dir=temp_dir,
+                   progress=progress)
+
+        def run():
+            try:
+                job['results'] = parseFiles(file_paths, temp_dir, progress)
+            except Exception:
+                job['error'] = sys.exc_info()[1]
+
+        job['thread'] = threading.Thread(target=run)
+        job['thread'].daemon = True
+        job['thread'].start()
+        self.job = job
+
+    def finish(self):
+        job, self.job = self.job, None
+        try:
+            if 'error' in job:
+                tooltip(_("Importing %(files)s failed: %(error)s") % dict(
+                    files=", ".join(os.path.basename(file_path)
+                                    for file_path in job['file_paths']),
+                    error=job['error']))
+                return
+            store = RowStore(
+                os.path.join(mw.pm.profileFolder(), "onenote_importer.db"))
+            try:
+                stats = Stats()
+                rows = []
+                for source, file_rows, file_map, file_stats \
+                        in job['results']:
+                    stats.merge(file_stats)
+                    rows.extend(store.filter(source, file_rows))
+                if rows:
+                    # Like `importNotes`, media is only moved into
+                    # collection.media once there are notes to add.
+                    media_dir = os.path.join(
+                        mw.pm.profileFolder(), "collection.media")
+                    file_map = merge_media(job['results'])
+                    try:
+                        runInBackground(
+                            _("Copying media..."), len(file_map),
+                            lambda progress: media.commit(
+                                file_map, media_dir,
+                                lambda done: progress.update(done=done)))
+                    except Cancelled:
+                        # The files are imported again once they change.
+                        return
+                    importer = MHTImporter(mw.col, rows)
+                    importer.allowHTML = True
+                    importer.initMapping()
+                    importer.importMode = 0
+                    did = mw.col.decks.id(self.deck_name)
+                    if did != importer.model['did']:
+                        importer.model['did'] = did
+                        mw.col.models.save(importer.model)
+                    addNotes(importer, stats, store)
+                    mw.reset()
+                else:
+                    store.commit()
+            finally:
+                store.close()
+            for file_path in job['file_paths']:
+                self.watcher.processed(file_path)
+            tooltip(_("Imported %(rows)d changed rows of %(files)d files "
+                      "from %(folder)s.") % dict(
+                rows=len(rows), files=len(job['file_paths']),
+                folder=self.watcher.directory))
+        finally:
+            removeStagingDir(job['temp_dir'])
+
+
+watchService = None
+
+
+def startWatching():
+    global watchService
+    if WATCH_FOLDER and os.path.isdir(WATCH_FOLDER):
+        watchService = WatchService(WATCH_FOLDER, WATCH_DECK)
+
+
+def stopWatching():
+    global watchService
+    if watchService:
+        watchService.stop()
+        watchService = None
+
+
+addHook("profileLoaded", startWatching)
+addHook("unloadProfile", stopWatching)
+
+action = QAction("Import mht...", mw)
+mw.connect(action, SIGNAL("triggered()"), importMHT)
+mw.form.menuTools.addAction(action)
+
+action = QAction("Import mht folder...", mw)
+mw.connect(action, SIGNAL("triggered()"), importMHTFolder)
+mw.form.menuTools.addAction(action)
@@ -0,0 +1,395 @@
+"""HTML backends used by `Parser` to find images and table rows.
+
+Every backend wraps a parsed document and exposes the handful of operations
+the parser needs, so the html library can be swapped without touching the
+parser. Elements are whatever the underlying library uses; only pass them
+back to the backend that returned them.
+"""
+import cgi
+import re
+from collections import OrderedDict
+from HTMLParser import HTMLParser
+
+# Bytes fed to a parser at a time when reading the page from a file.
+CHUNK_SIZE = 64 * 1024
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+
+class Backend(object):
+    name = None
+
+    def __init__(self, html):
+        """`html` is the page as a utf-8 encoded str, or a file to read it
+        from."""
+        raise NotImplementedError
+
+    def images(self, element=None):
+        """Return every `<img>` element in the document, or inside
+        `element`."""
+        raise NotImplementedError
+
+    def get(self, element, attribute):
+        raise NotImplementedError
+
+    def set(self, element, attribute, value):
+        raise NotImplementedError
+
+    def tables(self):
+        """Return every `<table>` element in document order."""
+        raise NotImplementedError
+
+    def walk_tables(self):
+        """Return a `(table, nested)` tuple for every `<table>` element in
+        document order, where `nested` tells whether it is inside another
+        table. The document is walked once."""
+        raise NotImplementedError
+
+    def remove(self, element):
+        """Take `element` out of the document. It can still be used on its
+        own, e.g. rendered."""
+        raise NotImplementedError
+
+    def release(self, element):
+        """Take `element` out of the document and free everything in it. It
+        must not be used afterwards."""
+        raise NotImplementedError
+
+    def rows(self, table):
+        """Return the `<tr>` elements directly inside `table`."""
+        raise NotImplementedError
+
+    def cells(self, row, limit=2):
+        """Return up to `limit` elements directly inside `row`, or all of
+        them when `limit` is `None`."""
+        raise NotImplementedError
+
+    def render(self, element):
+        """Return the html inside `element` as a utf-8 encoded str."""
+        raise NotImplementedError
+
+
+class BeautifulSoupBackend(Backend):
+    name = 'beautifulsoup'
+
+    def __init__(self, html):
+        from BeautifulSoup import BeautifulSoup
+        if not isinstance(html, basestring):
+            html = html.read()
+        # The page already is utf-8, there is no need to guess.
+        self.soup = BeautifulSoup(html, fromEncoding='utf-8')
+
+    def images(self, element=None):
+        return (self.soup if element is None else element).findAll('img')
+
+    def get(self, element, attribute):
+        return element.get(attribute)
+
+    def set(self, element, attribute, value):
+        element[attribute] = value
+
+    def tables(self):
+        return self.soup.findAll('table')
+
+    def walk_tables(self):
+        from BeautifulSoup import Tag
+        tables = []
+        stack = [(self.soup, False)]
+        while stack:
+            element, nested = stack.pop()
+            if element.name == 'table':
+                tables.append((element, nested))
+                nested = True
+            stack.extend((child, nested)
+                         for child in reversed(element.contents)
+                         if isinstance(child, Tag))
+        return tables
+
+    def remove(self, element):
+        element.extract()
+
+    def release(self, element):
+        # Breaks the links between the elements, so they are freed without
+        # waiting for the garbage collector.
+        element.decompose()
+
+    def rows(self, table):
+        return table.findAll('tr', recursive=False)
+
+    def cells(self, row, limit=2):
+        return row.findAll(recursive=False, limit=limit)
+
+    def render(self, element):
+        return element.renderContents()
+
+
+class LxmlBackend(Backend):
+    """Backend built on libxml2's html parser."""
+    name = 'lxml'
+
+    def __init__(self, html):
+        if lxml is None:
+            raise ImportError('lxml is not installed')
+        parser = lxml.html.HTMLParser(encoding='utf-8')
+        if isinstance(html, basestring):
+            self.root = lxml.html.document_fromstring(html, parser=parser)
+        else:
+            # libxml2 reads the file in chunks.
+            self.root = lxml.html.parse(html, parser=parser).getroot()
+
+    def images(self, element=None):
+        return list((self.root if element is None else element).iter('img'))
+
+    def get(self, element, attribute):
+        return element.get(attribute)
+
+    def set(self, element, attribute, value):
+        element.set(attribute, value)
+
+    def tables(self):
+        return list(self.root.iter('table'))
+
+    def walk_tables(self):
+        tables = []
+        depth = 0
+        for event, element in lxml.etree.iterwalk(
+                self.root, events=('start', 'end'), tag='table'):
+            if event == 'start':
+                tables.append((element, depth > 0))
+                depth += 1
+            else:
+                depth -= 1
+        return tables
+
+    def remove(self, element):
+        # The text after the element stays in the document.
+        element.drop_tree()
+
+    def release(self, element):
+        if element.getparent() is not None:
+            element.drop_tree()
+        element.clear()
+
+    def rows(self, table):
+        return list(table.iterchildren('tr'))
+
+    def cells(self, row, limit=2):
+        # Comments and processing instructions are children too, but their
+        # tag is not a string.
+        cells = [child for child in row if isinstance(child.tag, basestring)]
+        return cells[:limit]
+
+    def render(self, element):
+        html = [_escape(element.text)]
+        for child in element:
+            # The child's tail, the text after it, is included.
+            html.append(lxml.html.tostring(child, encoding='utf-8'))
+        return ''.join(html)
+
+
+class HTMLParserBackend(Backend):
+    """Pure Python fallback built on the standard library's `HTMLParser`.
+
+    It builds a minimal tree that keeps text, entities and comments exactly
+    as they were in the source.
+    """
+    name = 'html.parser'
+
+    def __init__(self, html):
+        builder = _TreeBuilder()
+        if isinstance(html, basestring):
+            builder.feed(html)
+        else:
+            for chunk in iter(lambda: html.read(CHUNK_SIZE), ''):
+                builder.feed(chunk)
+        builder.close()
+        self.root = builder.root
+
+    def images(self, element=None):
+        return list((self.root if element is None else element).iter('img'))
+
+    def get(self, element, attribute):
+        return element.get(attribute)
+
+    def set(self, element, attribute, value):
+        element.set(attribute, value)
+
+    def tables(self):
+        return list(self.root.iter('table'))
+
+    def walk_tables(self):
+        tables = []
+        stack = [(self.root, False)]
+        while stack:
+            element, nested = stack.pop()
+            if element.tag == 'table':
+                tables.append((element, nested))
+                nested = True
+            stack.extend((child, nested)
+                         for child in reversed(list(element.elements())))
+        return tables
+
+    def remove(self, element):
+        element.parent.children.remove(element)
+        element.parent = None
+
+    def release(self, element):
+        if element.parent is not None:
+            self.remove(element)
+        element.children = []
+
+    def rows(self, table):
+        return [child for child in table.elements() if child.tag == 'tr']
+
+    def cells(self, row, limit=2):
+        return list(row.elements())[:limit]
+
+    def render(self, element):
+        return element.render_contents()
+
+
+# Elements that never have content or an end tag.
+_VOID = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+])
+
+
+class _Element(object):
+    # Pages have hundreds of thousands of elements, so they are kept small:
+    # no instance dict, and attributes are a list of `(name, value)` pairs.
+    __slots__ = ('tag', 'attrs', 'parent', 'children')
+
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        # Elements and raw html strings.
+        self.children = []
+
+    def get(self, name):
+        for key, value in self.attrs:
+            if key == name:
+                return value
+        return None
+
+    def set(self, name, value):
+        for index, (key, _value) in enumerate(self.attrs):
+            if key == name:
+                self.attrs[index] = (name, value)
+                return
+        self.attrs.append((name, value))
+
+    def elements(self):
+        return (child for child in self.children
+                if isinstance(child, _Element))
+
+    def iter(self, tag):
+        for child in self.elements():
+            if child.tag == tag:
+                yield child
+            for element in child.iter(tag):
+                yield element
+
+    def render(self):
+        html = ['<', self.tag]
+        for name, value in self.attrs:
+            if value is None:
+                html.append(' %s' % name)
+            else:
+                html.append(' %s="%s"' % (name, _escape(value, True)))
+        html.append('>')
+        if self.tag not in _VOID:
+            html.append(self.render_contents())
+            html.append('</%s>' % self.tag)
+        return ''.join(html)
+
+    def render_contents(self):
+        return ''.join(child if isinstance(child, str) else child.render()
+                       for child in self.children)
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.root = _Element(None, [])
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        element = _Element(tag, attrs, self.stack[-1])
+        self.stack[-1].children.append(element)
+        if tag not in _VOID:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.stack[-1].children.append(
+            _Element(tag, attrs, self.stack[-1]))
+
+    def handle_endtag(self, tag):
+        # Close any elements left open inside this one. Stray end tags are
+        # ignored.
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+    def unescape(self, s):
+        # Used for attribute values. The standard one returns unicode when
+        # there is an entity, which fails on the utf-8 text around it, so
+        # every entity is replaced by its utf-8 encoding instead.
+        if '&' not in s:
+            return s
+        return _ENTITY.sub(
+            lambda match: _utf8(HTMLParser.unescape(self, match.group(0))), s)
+
+    def handle_entityref(self, name):
+        self.stack[-1].children.append('&%s;' % name)
+
+    def handle_charref(self, name):
+        self.stack[-1].children.append('&#%s;' % name)
+
+    def handle_comment(self, data):
+        self.stack[-1].children.append('<!--%s-->' % data)
+
+    def handle_decl(self, decl):
+        self.stack[-1].children.append('<!%s>' % decl)
+
+    def handle_pi(self, data):
+        self.stack[-1].children.append('<?%s>' % data)
+
+
+# Entities as `HTMLParser.unescape` finds them.
+_ENTITY = re.compile(r'&(#?[xX]?(?:[0-9a-fA-F]+|\w{1,8}));')
+
+
+def _utf8(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
+
+
+def _escape(text, quote=False):
+    if not text:
+        return ''
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return cgi.escape(text, quote)
+
+
+BACKENDS = OrderedDict(
+    (backend.name, backend)
+    for backend in (LxmlBackend, HTMLParserBackend, BeautifulSoupBackend))
+
+
+def get(name=None):
+    """Return the backend called `name`, or the fastest one available."""
+    if name is not None:
+        return BACKENDS[name]
+    return LxmlBackend if lxml is not None else HTMLParserBackend
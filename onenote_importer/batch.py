@@ -0,0 +1,209 @@
+import multiprocessing
+import os
+
+from parser import Parser
+from stats import Stats
+import media
+import sources
+
+# Seconds between looks at the workers' progress, and so at whether the
+# import was cancelled.
+POLL_INTERVAL = 0.1
+
+# Bytes read and rows rendered by the file each worker parses, by index of
+# the file, see `_init_worker`.
+_progress = None
+
+
+def parse_files(file_paths, processes=None, progress=None, cache=None,
+                tables=None, **options):
+    """Parse many exports at once in a pool of worker processes.
+
+    `options` are passed on to every `Parser`. `processes` defaults to the
+    number of CPUs; with a single file, or `processes=1`, everything runs in
+    this process.
+
+    `tables` optionally lists the `tables` option of each file's `Parser`,
+    e.g. the ones picked from a `census`.
+
+    `cache` is an optional `cache.ResultCache`. Files found in it are not
+    parsed at all, and the results of the others are added to it.
+
+    `progress` is an optional `progress.Progress` whose total is the size of
+    all files in bytes. It is updated as every file is read, by the workers
+    of a pool through shared memory. When it raises, e.g. once cancelled, the
+    workers are stopped at once and the media staged so far is discarded. Workers that are
+    stopped halfway may leave temp files behind, so pass a `temp_dir` option
+    that can be removed afterwards.
+
+    Returns a `(source, rows, file_map, stats)` tuple per file, in the order
+    of `file_paths`.
+    """
+    results = {}
+    done = {'bytes': 0, 'rows': 0}
+    if tables is None:
+        tables = [None] * len(file_paths)
+
+    def finish(index, result):
+        results[index] = result
+        done['bytes'] += sources.size(file_paths[index])
+        done['rows'] += len(result[1])
+
+    def report(bytes_read=0, rows=0):
+        if progress:
+            progress.update(done=done['bytes'] + bytes_read,
+                            rows=done['rows'] + rows)
+
+    try:
+        pending = []
+        for index, file_path in enumerate(file_paths):
+            cached = None
+            # Folders are not cached, they would have to be hashed whole.
+            if cache and os.path.isfile(file_path):
+                stats = Stats()
+                with stats.timer('cache_load'):
+                    cached = cache.get(
+                        file_path, options.get('media_dir'),
+                        options.get('temp_dir'), _variant(tables[index]))
+            if cached is None:
+                pending.append(index)
+                continue
+            stats.count('cache_hits')
+            rows, file_map = cached
+            finish(index, (os.path.abspath(file_path), rows, file_map, stats))
+            report()
+
+        if len(pending) <= 1 or processes == 1:
+            for index in pending:
+                parser = Parser(file_paths[index], progress=report,
+                                tables=tables[index], **options)
+                finish(index, (parser.source, parser.rows(),
+                               parser.file_map, parser.stats))
+                _remember(cache, file_paths[index], tables[index],
+                          results[index])
+        else:
+            # Workers report their progress through shared memory, which is
+            # passed on while waiting for them. Cancelling it terminates the
+            # pool right away.
+            bytes_read = multiprocessing.Array('d', len(file_paths),
+                                               lock=False)
+            rows_read = multiprocessing.Array('d', len(file_paths),
+                                              lock=False)
+
+            def report_workers():
+                report(int(sum(bytes_read)), int(sum(rows_read)))
+
+            pool = multiprocessing.Pool(processes, _init_worker,
+                                        (bytes_read, rows_read))
+            try:
+                jobs = [(index, file_paths[index],
+                         dict(options, tables=tables[index]))
+                        for index in pending]
+                outcomes = pool.imap_unordered(_parse_reporting, jobs)
+                for _ in pending:
+                    while True:
+                        try:
+                            index, result = outcomes.next(POLL_INTERVAL)
+                            break
+                        except multiprocessing.TimeoutError:
+                            report_workers()
+                    bytes_read[index] = rows_read[index] = 0
+                    finish(index, result)
+                    _remember(cache, file_paths[index], tables[index],
+                              result)
+                    report_workers()
+            finally:
+                pool.terminate()
+                pool.join()
+        return [results[index] for index in range(len(file_paths))]
+    except:
+        for source, rows, file_map, stats in results.values():
+            media.discard(file_map)
+        raise
+
+
+def _remember(cache, file_path, tables, result):
+    if cache and os.path.isfile(file_path):
+        source, rows, file_map, stats = result
+        with stats.timer('cache_store'):
+            cache.put(file_path, rows, file_map, _variant(tables))
+
+
+def _variant(tables):
+    # Results of different table selections are cached apart.
+    return '' if tables is None else ','.join(map(str, sorted(tables)))
+
+
+def iter_parse(file_paths, processes=None, **options):
+    """Parse many exports in a pool of worker processes, like
+    `parse_files`, but yield the results as they come in.
+
+    Yields a `(file_path, result, error)` tuple per file, in the order of
+    `file_paths`. `result` is a `(source, rows, file_map, stats)` tuple, or
+    `None` when the file couldn't be parsed, in which case `error` says why.
+    A broken file doesn't stop the others, and only the results not yet
+    consumed are kept in memory.
+    """
+    jobs = [(file_path, options) for file_path in file_paths]
+    if len(jobs) <= 1 or processes == 1:
+        for job in jobs:
+            yield _try_parse(job)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for outcome in pool.imap(_try_parse, jobs):
+            yield outcome
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _try_parse(job):
+    try:
+        return job[0], _parse(job), None
+    except Exception as error:
+        return job[0], None, '%s: %s' % (type(error).__name__, error)
+
+
+def _init_worker(bytes_read, rows_read):
+    global _progress
+    _progress = (bytes_read, rows_read)
+
+
+def _parse_reporting(job):
+    # Like `_parse`, but reports the progress to `parse_files`.
+    index, file_path, options = job
+
+    def report(bytes_read, rows):
+        _progress[0][index] = bytes_read
+        _progress[1][index] = rows
+
+    parser = Parser(file_path, progress=report, **options)
+    rows = parser.rows()
+    return index, (parser.source, rows, parser.file_map, parser.stats)
+
+
+def _parse(job):
+    # Runs in a worker, so only picklable results are sent back.
+    file_path, options = job
+    parser = Parser(file_path, **options)
+    rows = parser.rows()
+    return parser.source, rows, parser.file_map, parser.stats
+
+
+def merge_media(results):
+    """Merge the media of several parsed files into one file map.
+
+    Exports that share an image each staged their own copy of it. As media
+    is named after its content only one copy is kept, and the temp files of
+    the others are removed.
+    """
+    file_map = {}
+    for source, rows, parsed_map, stats in results:
+        for meta in parsed_map.values():
+            filename = meta.get('filename')
+            if filename not in file_map:
+                file_map[filename] = meta
+            elif meta.get('path'):
+                os.remove(meta.get('path'))
+    return file_map
@@ -0,0 +1,245 @@
+import cPickle as pickle
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+from tempfile import mkstemp
+
+import media
+
+# Bytes of a source file hashed at a time.
+CHUNK_SIZE = 1024 * 1024
+
+# Told apart from a result's key, so the census of a file is kept apart.
+# Changed whenever what a census holds changes.
+CENSUS = 'census-2'
+
+
+class ResultCache(object):
+    """Keeps the parsed rows and staged media of exports on disk.
+
+    Reopening an export, e.g. after cancelling the import dialog to pick
+    another deck, then skips parsing it altogether. Results are keyed by the
+    digest of the file's content and the `settings` it was parsed with. The
+    digest is remembered by path, size and mtime, so an unchanged file is
+    not even read again.
+
+    Every result is a folder in `directory` with the rows and its own copy
+    of the staged media, hard linked when possible as media is never changed
+    in place, see `media.link`. Media that was already in the media folder
+    is not copied. When the cache grows past `max_bytes` the results used
+    longest ago are removed.
+
+    The census of a file, see `census.scan`, is kept the same way, so the
+    import dialog of a file opened before shows up without reading it. It
+    is keyed by the file's path, size and mtime instead of its digest, so a
+    file opened the first time is not hashed before the dialog shows up.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, settings=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.settings = settings
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        db = self._connect()
+        try:
+            _create(db)
+        finally:
+            db.close()
+
+    def get(self, file_path, media_dir=None, temp_dir=None, variant=''):
+        """Return the cached `(rows, file_map)` of `file_path`, or `None`.
+
+        The media is staged again in `temp_dir`, just like `Parser` would
+        have done. `variant` tells apart results of the same file and
+        settings, e.g. of different tables.
+        """
+        db = self._connect()
+        try:
+            key = self._key(db, file_path, variant)
+            found = db.execute(
+                'select 1 from results where key = ?', (key,)).fetchone()
+            if not found:
+                return None
+            entry = os.path.join(self.directory, key)
+            try:
+                with open(os.path.join(entry, 'result'), 'rb') as file_:
+                    rows, filenames = pickle.load(file_)
+            except (IOError, EOFError, pickle.UnpicklingError):
+                self._remove(db, key)
+                return None
+
+            file_map = {}
+            try:
+                for path, filename in filenames.items():
+                    file_map[path] = {
+                        'filename': filename,
+                        'path': _stage(entry, filename, media_dir, temp_dir),
+                    }
+            except (IOError, OSError):
+                # Media went missing from the cache or the media folder.
+                for meta in file_map.values():
+                    if meta['path']:
+                        os.remove(meta['path'])
+                self._remove(db, key)
+                return None
+
+            db.execute('update results set used = ? where key = ?',
+                       (time.time(), key))
+            db.commit()
+            return rows, file_map
+        finally:
+            db.close()
+
+    def put(self, file_path, rows, file_map, variant=''):
+        """Remember the rows and staged media of `file_path`.
+
+        The staged files are left where they are, so they can still be moved
+        into the media folder.
+        """
+        db = self._connect()
+        try:
+            key = self._key(db, file_path, variant)
+            self._remove(db, key)
+            entry = os.path.join(self.directory, key)
+            os.makedirs(entry)
+            size = 0
+            filenames = {}
+            for path, meta in file_map.items():
+                filenames[path] = meta.get('filename')
+                if meta.get('path'):
+                    target = os.path.join(entry, meta.get('filename'))
+                    if not os.path.exists(target):
+                        media.link(meta.get('path'), target, hard=True)
+                        size += os.path.getsize(target)
+            with open(os.path.join(entry, 'result'), 'wb') as file_:
+                pickle.dump((rows, filenames), file_, pickle.HIGHEST_PROTOCOL)
+                size += file_.tell()
+
+            db.execute('insert into results values (?, ?, ?)',
+                       (key, size, time.time()))
+            self._evict(db, key)
+            db.commit()
+        finally:
+            db.close()
+
+    def get_census(self, file_path):
+        """Return what `put_census` stored for `file_path`, or `None`."""
+        db = self._connect()
+        try:
+            key = self._census_key(file_path)
+            found = db.execute(
+                'select 1 from results where key = ?', (key,)).fetchone()
+            if not found:
+                return None
+            try:
+                with open(os.path.join(self.directory, key, 'census'),
+                          'rb') as file_:
+                    census = pickle.load(file_)
+            except (IOError, EOFError, pickle.UnpicklingError):
+                self._remove(db, key)
+                return None
+            db.execute('update results set used = ? where key = ?',
+                       (time.time(), key))
+            db.commit()
+            return census
+        finally:
+            db.close()
+
+    def put_census(self, file_path, census):
+        """Remember the census of `file_path`, any picklable value."""
+        db = self._connect()
+        try:
+            key = self._census_key(file_path)
+            self._remove(db, key)
+            entry = os.path.join(self.directory, key)
+            os.makedirs(entry)
+            with open(os.path.join(entry, 'census'), 'wb') as file_:
+                pickle.dump(census, file_, pickle.HIGHEST_PROTOCOL)
+                size = file_.tell()
+            db.execute('insert into results values (?, ?, ?)',
+                       (key, size, time.time()))
+            self._evict(db, key)
+            db.commit()
+        finally:
+            db.close()
+
+    def _key(self, db, file_path, variant):
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        found = db.execute(
+            'select digest from files where path = ? and size = ? '
+            'and mtime = ?', (path, stat.st_size, stat.st_mtime)).fetchone()
+        if found:
+            digest = found[0]
+        else:
+            digest = _digest(path)
+            db.execute('insert or replace into files values (?, ?, ?, ?)',
+                       (path, stat.st_size, stat.st_mtime, digest))
+            db.commit()
+        return hashlib.sha1(
+            '\0'.join((digest, self.settings, variant))).hexdigest()
+
+    def _census_key(self, file_path):
+        path = os.path.abspath(file_path)
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        stat = os.stat(path)
+        return hashlib.sha1('\0'.join((
+            path, str(stat.st_size), repr(stat.st_mtime), self.settings,
+            CENSUS))).hexdigest()
+
+    def _evict(self, db, keep):
+        total = db.execute(
+            'select coalesce(sum(size), 0) from results').fetchone()[0]
+        for key, size in db.execute(
+                'select key, size from results where key != ? '
+                'order by used', (keep,)).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._remove(db, key)
+            total -= size
+
+    def _remove(self, db, key):
+        db.execute('delete from results where key = ?', (key,))
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+    def _connect(self):
+        # A connection per call, as the cache is used from whichever thread
+        # parses the files.
+        return sqlite3.connect(os.path.join(self.directory, 'cache.db'))
+
+
+def _create(db):
+    db.execute(
+        'create table if not exists files ('
+        'path text primary key, size integer not null, '
+        'mtime real not null, digest text not null)')
+    db.execute(
+        'create table if not exists results ('
+        'key text primary key, size integer not null, used real not null)')
+    db.commit()
+
+
+def _digest(path):
+    hash_ = hashlib.sha1()
+    with open(path, 'rb') as file_:
+        for chunk in iter(lambda: file_.read(CHUNK_SIZE), ''):
+            hash_.update(chunk)
+    return hash_.hexdigest()
+
+
+def _stage(entry, filename, media_dir, temp_dir):
+    # Media that is in the media folder already needs no temp file.
+    if media_dir and os.path.exists(os.path.join(media_dir, filename)):
+        return None
+    source = os.path.join(entry, filename)
+    if not os.path.exists(source):
+        raise IOError('%s is not cached' % filename)
+    fd, path = mkstemp(suffix=filename, dir=temp_dir)
+    os.close(fd)
+    os.remove(path)
+    media.link(source, path, hard=True)
+    return path
@@ -0,0 +1,108 @@
+import os
+
+import backends
+import mht
+import sources
+
+
+class Table(object):
+    """What a table of an export holds, counted without rendering it.
+
+    `index` is the position of the table in the page, as `Parser` numbers
+    them, and `nested` whether it is inside another table. `columns` is the
+    most cells any of its rows has, and `images` the number of images in it
+    that refer to media, including those of nested tables. `cards` is the
+    number of rows with at least two cells, the ones `Parser` imports.
+    """
+
+    def __init__(self, index, nested, rows, columns, images, cards):
+        self.index = index
+        self.nested = nested
+        self.rows = rows
+        self.columns = columns
+        self.images = images
+        self.cards = cards
+
+    @property
+    def importable(self):
+        # Every row becomes a note of a front and a back side.
+        return self.cards > 0
+
+
+def scan(file_path, backend=None, memory_budget=None):
+    """Return a `Table` for every table of the export at `file_path`, a .mht
+    or a folder or zip file, see `sources`.
+
+    This is cheap next to parsing it with `Parser`: the archive is only read
+    up to the page, no media is decoded and no cell rendered. A page larger
+    than `memory_budget` bytes is spooled to disk.
+    """
+    document = None
+    if sources.is_export(file_path):
+        for part in sources.iter_parts(file_path):
+            document = _load(part, backend, memory_budget)
+            break
+    else:
+        with open(file_path, 'rb') as file_:
+            for part in mht.iter_parts(file_):
+                document = _load(part, backend, memory_budget)
+                if document is not None:
+                    break
+    if document is None:
+        return []
+
+    tables = []
+    for index, (table, nested) in enumerate(document.walk_tables()):
+        rows = document.rows(table)
+        cells = [len(document.cells(row, limit=None)) for row in rows]
+        images = sum(1 for img in document.images(table)
+                     if document.get(img, 'src'))
+        tables.append(Table(index, nested, len(rows), max(cells or [0]),
+                            images, sum(1 for count in cells if count >= 2)))
+    return tables
+
+
+def _load(part, backend, memory_budget):
+    if part.content_type != 'text/html':
+        return None
+    html = mht.read_utf8(part, memory_budget)
+    document = backends.get(backend)(html)
+    if not isinstance(html, basestring):
+        html.close()
+    return document
+
+
+def scan_files(file_paths, backend=None, progress=None, memory_budget=None,
+               cache=None):
+    """Scan several exports, see `scan`.
+
+    `progress` is an optional `progress.Progress` whose total is the number
+    of files. `cache` is an optional `cache.ResultCache` the census of files
+    is kept in, so they are only scanned once. Returns a `(source, tables)`
+    tuple per file.
+    """
+    results = []
+    for done, file_path in enumerate(file_paths):
+        if progress:
+            progress.update(done=done)
+        results.append((os.path.abspath(file_path),
+                        _scan_cached(file_path, backend, memory_budget,
+                                     cache)))
+    return results
+
+
+def _scan_cached(file_path, backend, memory_budget, cache):
+    # Folders are not cached, their mtime doesn't change with their files.
+    if not cache or not os.path.isfile(file_path):
+        return scan(file_path, backend, memory_budget)
+    found = cache.get_census(file_path)
+    if found is not None:
+        return [Table(*values) for values in found]
+    tables = scan(file_path, backend, memory_budget)
+    # Stored as plain tuples, which unpickle whichever way this module was
+    # imported.
+    cache.put_census(file_path, [
+        (table.index, table.nested, table.rows, table.columns, table.images,
+         table.cards)
+        for table in tables])
+    return tables
@@ -0,0 +1,224 @@
+"""Convert OneNote exports without Anki, e.g. on a server.
+
+Usage:
+    python -m onenote_importer.cli [options] EXPORT [EXPORT ...]
+
+Every export, a .mht file or one of the folders and zip files `sources`
+reads, is parsed like the add-on does and its rows are written out once it
+is parsed, as tab separated lines or as JSON Lines. Folders that hold .mht
+files are searched for them, and patterns like `notes/*.mht` are expanded.
+Images are written to the media folder, named after their content like in
+Anki's, together with a manifest of which export uses which image. At the
+end the number of files, rows and megabytes read per second is printed.
+
+Settings not given as options are taken from `config`.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+from tempfile import mkdtemp
+
+import backends
+import config
+import media
+from batch import iter_parse, merge_media
+from parser import NESTED_TABLE_POLICIES
+from stats import Stats
+
+FORMATS = ('tsv', 'jsonl')
+
+
+def find_exports(patterns):
+    """Return the exports named by `patterns`: files, patterns of them, or
+    folders, which are searched for .mht files or are an export."""
+    exports = []
+    for pattern in patterns:
+        paths = [pattern]
+        if glob.has_magic(pattern):
+            paths = sorted(glob.glob(pattern))
+        for path in paths:
+            if not os.path.isdir(path):
+                exports.append(path)
+                continue
+            found = sorted(
+                os.path.join(dirpath, filename)
+                for dirpath, dirnames, filenames in os.walk(path)
+                for filename in filenames
+                if filename.lower().endswith('.mht'))
+            if not found and _has_page(path):
+                found = [path]
+            exports.extend(found)
+    return exports
+
+
+def convert(exports, output, format='tsv', media_dir='media',
+            manifest=None, processes=None, **options):
+    """Write the rows of `exports` to the file `output`, and their media to
+    `media_dir`.
+
+    `manifest`, if given, is a file that a JSON line is written to per
+    export, with its media or the error that stopped it. `options` are
+    passed on to every `Parser`. Returns a `Stats` of the whole run, with
+    the files converted and failed counted, besides what `Parser` counts.
+    """
+    write = _write_jsonl if format == 'jsonl' else _write_tsv
+    if not os.path.isdir(media_dir):
+        os.makedirs(media_dir)
+    # Staged next to the media folder, so images are renamed into it.
+    temp_dir = mkdtemp(prefix='.staging-', dir=media_dir)
+    stats = Stats()
+    try:
+        with stats.timer('convert'):
+            for file_path, result, error in iter_parse(
+                    exports, processes, media_dir=media_dir,
+                    temp_dir=temp_dir, **options):
+                if result is None:
+                    stats.count('files_failed')
+                    _warn('%s: %s' % (file_path, error))
+                    if manifest:
+                        _write_line(manifest, {
+                            'source': _text(os.path.abspath(file_path)),
+                            'error': _text(error)})
+                    continue
+                source, rows, file_map, file_stats = result
+                media.commit(merge_media([result]), media_dir)
+                for row in rows:
+                    write(output, source, row)
+                if manifest:
+                    _write_line(manifest, {
+                        'source': _text(source),
+                        'rows': len(rows),
+                        'media': dict(
+                            (_text(path), meta['filename'])
+                            for path, meta in file_map.items())})
+                # The parser counts the rows and bytes read.
+                stats.merge(file_stats)
+                stats.count('files')
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return stats
+
+
+def throughput(stats):
+    """Describe the speed of a `convert` run."""
+    seconds = max(stats.seconds.get('convert', 0.0), 1e-6)
+    files = stats.counters.get('files', 0)
+    rows = stats.counters.get('rows', 0)
+    megabytes = stats.counters.get('bytes_read', 0) / 1e6
+    lines = [
+        '%d files, %d rows, %.1f MB in %.2fs' % (
+            files, rows, megabytes, seconds),
+        '%.1f files/s, %.0f rows/s, %.1f MB/s' % (
+            files / seconds, rows / seconds, megabytes / seconds),
+    ]
+    failed = stats.counters.get('files_failed')
+    if failed:
+        lines.append('%d files failed' % failed)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m onenote_importer.cli',
+        description=__doc__.splitlines()[0])
+    parser.add_argument('exports', nargs='+', metavar='EXPORT',
+                        help='.mht file, folder, zip file or pattern')
+    parser.add_argument('-o', '--output', default='-',
+                        help='file the rows are written to, - for stdout')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='tsv',
+                        help='tab separated rows, or a JSON object per row '
+                             'with its source')
+    parser.add_argument('-m', '--media', default='media',
+                        help='folder the images are written to')
+    parser.add_argument('--manifest',
+                        help='JSON Lines file of the images of every export '
+                             'and the errors, MEDIA/manifest.jsonl by default')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes, one per CPU by default')
+    parser.add_argument('--backend', default=config.BACKEND,
+                        choices=list(backends.BACKENDS),
+                        help='html library used to read the pages')
+    parser.add_argument('--nested-tables', default=config.NESTED_TABLES,
+                        choices=NESTED_TABLE_POLICIES,
+                        help='what to do with tables inside table cells')
+    parser.add_argument('--all-media', action='store_true',
+                        default=not config.REFERENCED_MEDIA_ONLY,
+                        help='also write images that no table refers to')
+    parser.add_argument('--link-media', action='store_true',
+                        default=config.LINK_MEDIA,
+                        help='hard link the images of unpacked exports '
+                             'instead of copying them')
+    parser.add_argument('--memory-budget', type=int,
+                        default=config.MEMORY_BUDGET, metavar='BYTES',
+                        help='bytes of a page or image kept in memory')
+    parser.add_argument('--stats', metavar='JSON',
+                        help='write the timings and counters to this file')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="don't print the throughput at the end")
+    args = parser.parse_args(argv)
+
+    exports = find_exports(args.exports)
+    if not exports:
+        parser.error('no exports found')
+
+    output = sys.stdout
+    if args.output != '-':
+        output = open(args.output, 'wb')
+    if not os.path.isdir(args.media):
+        os.makedirs(args.media)
+    manifest = open(
+        args.manifest or os.path.join(args.media, 'manifest.jsonl'), 'wb')
+    try:
+        stats = convert(
+            exports, output, args.format, args.media, manifest, args.jobs,
+            streaming=config.STREAMING, backend=args.backend,
+            referenced_only=not args.all_media,
+            nested_tables=args.nested_tables,
+            memory_budget=args.memory_budget, link_media=args.link_media)
+    finally:
+        manifest.close()
+        if output is not sys.stdout:
+            output.close()
+
+    if args.stats:
+        stats.dump(args.stats)
+    if not args.quiet:
+        _warn(throughput(stats))
+    return 1 if stats.counters.get('files_failed') else 0
+
+
+def _has_page(directory):
+    return any(name.lower().endswith(('.htm', '.html'))
+               for name in os.listdir(directory))
+
+
+def _write_tsv(output, source, row):
+    output.write('%s\t%s\n' % row)
+
+
+def _write_jsonl(output, source, row):
+    question, answer = row
+    _write_line(output, {'source': _text(source), 'front': _text(question),
+                         'back': _text(answer)})
+
+
+def _write_line(output, value):
+    output.write(json.dumps(value, sort_keys=True) + '\n')
+
+
+def _text(string):
+    # Paths and rows are utf-8 encoded str, but may not be valid utf-8.
+    if isinstance(string, unicode):
+        return string
+    return string.decode('utf-8', 'replace')
+
+
+def _warn(message):
+    sys.stderr.write(message + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Settings of the add-on.
+
+They are read by the add-on in Anki, see `addon`, and are the defaults of
+the command line, see `cli`.
+"""
+import os
+
+# Read the .mht part by part and write images to disk as they are decoded,
+# instead of loading the whole export into memory first.
+STREAMING = True
+
+# Remember imported rows so re-importing an export only adds new rows and
+# updates edited ones. Unchanged rows are skipped.
+INCREMENTAL = False
+
+# Html library used to read the page: 'lxml', 'html.parser' or
+# 'beautifulsoup'. `None` picks the fastest one that is installed.
+BACKEND = None
+
+# What to do with a table inside a cell of another table: 'inline' keeps it
+# in the cell, 'separate' imports its rows as cards of their own and 'skip'
+# leaves it out.
+NESTED_TABLES = 'inline'
+
+# Only decode and import the images that are used inside the tables. OneNote
+# exports often carry many images outside of them.
+REFERENCED_MEDIA_ONLY = True
+
+# Bytes of a page or image that may be kept in memory while reading a file.
+# Larger ones are spooled to disk, tables are freed as soon as their cards
+# are made, and files are read one at a time. Set it, e.g. to 64 MB, to
+# import very large notebooks on computers with little memory. `None` keeps
+# memory use unbounded.
+MEMORY_BUDGET = None
+
+# Hard link the images of exports unpacked to a folder into the media folder,
+# which takes no space. Leave it off if the exports are saved again in place:
+# the images in the media folder would change along with them, and be synced
+# as they are. Otherwise they are cloned where the file system allows, or
+# copied.
+LINK_MEDIA = False
+
+# Downscale images to at most MAX_IMAGE_DIMENSION pixels and re-encode them
+# before they are imported, which needs Pillow. Lossless keeps them PNGs;
+# LOSSY_IMAGES turns them into JPEGs of JPEG_QUALITY.
+OPTIMIZE_IMAGES = False
+MAX_IMAGE_DIMENSION = 1600
+LOSSY_IMAGES = False
+JPEG_QUALITY = 85
+
+# Folder where what was learnt about imported files is cached, so importing
+# them again is faster. `None` disables caching.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# Parsed rows and media of recently imported files are kept in CACHE_DIR up
+# to this many bytes, so reopening a file doesn't parse it again.
+CACHE_SIZE = 512 * 1024 * 1024
+
+# Prefix of the hidden folders in the profile folder where media is staged.
+STAGING_PREFIX = ".onenote_importer-"
+
+# Path of a JSON file to write the import's timings and counters to, e.g. to
+# attach to a report about a slow import. They are always shown at the end
+# of the import.
+STATS_JSON = None
+
+# Folder to watch for .mht files, which are imported in the background as
+# soon as they are saved or changed, e.g. a folder OneNote exports are synced
+# to. Only new and edited rows are imported, as with INCREMENTAL. `None`
+# watches nothing.
+WATCH_FOLDER = None
+
+# Name of the deck watched files are imported into.
+WATCH_DECK = "Default"
+
+# Seconds between looks at the watch folder, and seconds a file's size and
+# mtime must stay the same before it is imported, so that files which are
+# still being written are left alone.
+WATCH_INTERVAL = 2
+WATCH_SETTLE = 5
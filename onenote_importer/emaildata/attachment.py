@@ -18,7 +18,7 @@ class Attachment(object):
     """
 
     @staticmethod
-    def extract(message, only_with_filename=True):
+    def extract(message, only_with_filename=True, decode=True):
         """
         Iterates by the attachments of the message.
 
@@ -29,6 +29,10 @@ class Attachment(object):
         only_only_with_filename: bool
             If its value is `True` (the default) returns only the attachments that have
             a file name. If `False` returns al the attachments.
+        decode: bool
+            If its value is `False` the content is not decoded and `None` is returned
+            instead. Use :class:`Text.decode_content_to` to decode it straight to a
+            file.
 
         Returns
         -------
@@ -47,12 +51,14 @@ class Attachment(object):
         if message.is_multipart():
             for attachment in message.get_payload():
                 if attachment.is_multipart() and attachment.get_content_type() == 'multipart/alternative':
-                    for item in Attachment.extract(attachment, only_with_filename):
+                    for item in Attachment.extract(attachment, only_with_filename, decode):
                         yield item
                     continue
                 if not only_with_filename or attachment.get_filename():
                     try:
-                        content = str(attachment) if attachment.is_multipart() else Text.decode_content(attachment)
+                        content = None
+                        if decode:
+                            content = str(attachment) if attachment.is_multipart() else Text.decode_content(attachment)
                         filename = Attachment.decode_filename(attachment.get_filename())
                         mimetype = attachment.get_content_type()
                         yield content, filename, mimetype, attachment
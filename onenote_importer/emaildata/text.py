@@ -8,9 +8,12 @@ __docformat__ = "restructuredtext es"
 __author__ = "Karel Antonio Verdecia Ortiz"
 __contact__ = "kverdecia@gmail.com"
 
+import binascii
 import email
-import cStringIO
-import mimetools
+import email.generator
+
+# Charsets whose text needs no conversion to be utf-8.
+UTF8_CHARSETS = frozenset(['utf-8', 'utf8', 'us-ascii', 'ascii'])
 
 
 class Text(object):
@@ -41,13 +44,42 @@ class Text(object):
             raise TypeError("Expected a message object.")
         encoding = message['Content-Transfer-Encoding']
         if encoding and encoding.strip() == 'quoted-printable':
-            result = message.get_payload()
-            stream = cStringIO.StringIO(result)
-            output = cStringIO.StringIO()
-            mimetools.decode(stream, output, 'quoted-printable')
-            return output.getvalue()
+            # binascii decodes in C in a single pass.
+            return binascii.a2b_qp(message.get_payload())
         return message.get_payload(decode=True)
 
+    @staticmethod
+    def decode_content_to(message, file_, chunk_size=64 * 1024):
+        """Decode the content of a message into a file. This method is similar to
+        :class:`Text.decode_content` but the payload is decoded in chunks of
+        `chunk_size` characters and written as it goes, so the decoded content is
+        never in memory as a whole. Multipart messages are written as they are.
+
+        Parameters
+        ----------
+        message: email.message.Message
+            Message to decode.
+        file_: file
+            File like object the decoded content is written to.
+        chunk_size: int
+            Number of encoded characters decoded at a time.
+
+        Raises
+        ------
+        TypeError
+            If the parameter is not an instance of :class:`email.message.Message`.
+        """
+        if not isinstance(message, email.message.Message):
+            raise TypeError("Expected a message object.")
+        if message.is_multipart():
+            email.generator.Generator(file_, mangle_from_=False).flatten(message)
+            return
+        payload = message.get_payload()
+        decoder = decoder_for(message['Content-Transfer-Encoding'])
+        for start in xrange(0, len(payload), chunk_size):
+            file_.write(decoder.feed(payload[start:start + chunk_size]))
+        file_.write(decoder.flush())
+
     @staticmethod
     def decode_text(message):
         """Extracts the text of the message and try to convert it to utf-8. This method
@@ -71,21 +103,39 @@ class Text(object):
         TypeError
             If the parameter is not an instance of :class:`email.message.Message`.
         """
-        def utf8(text):
-            try:
-                charset = message.get_content_charset()
-                if charset:
-                    return text.decode(charset).encode('utf-8')
-            except LookupError:
-                return text
-            except (UnicodeDecodeError, UnicodeEncodeError):
-                return text
-            return text
         try:
-            return utf8(Text.decode_content(message))
+            return Text.to_utf8(Text.decode_content(message),
+                                message.get_content_charset())
         except (UnicodeDecodeError, UnicodeEncodeError):
             return message.get_payload().encode('ascii')
 
+    @staticmethod
+    def to_utf8(text, charset):
+        """Converts text in the given charset to utf-8. Text that already is utf-8,
+        or ascii, is returned as it is without decoding it.
+
+        Parameters
+        ----------
+        text: str
+            Text to convert.
+        charset: str
+            Charset of the text. If it is `None` the text is returned as it is.
+
+        Returns
+        -------
+        content: str
+            Text encoded to utf-8. If it cannot encode the text to utf-8 the text
+            will be returned as it is.
+        """
+        if not charset or charset.lower() in UTF8_CHARSETS:
+            return text
+        try:
+            return text.decode(charset).encode('utf-8')
+        except LookupError:
+            return text
+        except (UnicodeDecodeError, UnicodeEncodeError):
+            return text
+
     @staticmethod
     def decoded(message, allowed_mimetypes=None):
         """
@@ -227,3 +277,62 @@ class Text(object):
         returned text.
         """
         return Text.undecoded(message, ['text/html'])
+
+
+def decoder_for(encoding):
+    """Returns an incremental decoder for a Content-Transfer-Encoding. Feed it the
+    encoded content in pieces of any size and it returns what could be decoded so
+    far.
+    """
+    encoding = (encoding or '').strip().lower()
+    if encoding == 'base64':
+        return Base64Decoder()
+    if encoding == 'quoted-printable':
+        return QuotedPrintableDecoder()
+    return Decoder()
+
+
+class Decoder(object):
+    """Passes 7bit, 8bit and binary content through untouched.
+    """
+    def feed(self, data):
+        return data
+
+    def flush(self):
+        return ''
+
+
+class Base64Decoder(Decoder):
+    """Decodes base64 in pieces. Characters that do not complete a group of four
+    are kept until the next piece.
+    """
+    def __init__(self):
+        self.pending = ''
+
+    def feed(self, data):
+        data = self.pending + ''.join(data.split())
+        end = len(data) - len(data) % 4
+        self.pending = data[end:]
+        return binascii.a2b_base64(data[:end]) if end else ''
+
+    def flush(self):
+        pending, self.pending = self.pending, ''
+        return binascii.a2b_base64(pending) if pending else ''
+
+
+class QuotedPrintableDecoder(Decoder):
+    """Decodes quoted-printable in pieces. Escapes never span lines, so the last
+    incomplete line is kept until the next piece.
+    """
+    def __init__(self):
+        self.pending = ''
+
+    def feed(self, data):
+        data = self.pending + data
+        end = data.rfind('\n') + 1
+        self.pending = data[end:]
+        return binascii.a2b_qp(data[:end]) if end else ''
+
+    def flush(self):
+        pending, self.pending = self.pending, ''
+        return binascii.a2b_qp(pending) if pending else ''
@@ -0,0 +1,29 @@
+from anki.importing.noteimp import NoteImporter, ForeignNote
+
+
+class MHTImporter(NoteImporter):
+    """Imports the rows of a `Parser` straight into the collection.
+
+    The rows are handed to Anki's note importer as they are, so there is no
+    text file to write and parse again, and cells may contain tabs. They are
+    utf-8 encoded, like all text in the add-on, and this is the one place
+    they are decoded.
+    """
+
+    def __init__(self, col, rows):
+        NoteImporter.__init__(self, col, None)
+        self.rows = rows
+        # Called with the number of notes handed to Anki so far.
+        self.progress = None
+
+    def fields(self):
+        return 2
+
+    def foreignNotes(self):
+        for count, (question, answer) in enumerate(self.rows):
+            if self.progress:
+                self.progress(count)
+            note = ForeignNote()
+            note.fields = [unicode(question, 'utf-8'),
+                           unicode(answer, 'utf-8')]
+            yield note
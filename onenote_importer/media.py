@@ -0,0 +1,233 @@
+import errno
+import os
+import hashlib
+import shutil
+from multiprocessing.pool import ThreadPool
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile, mkstemp
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Decoded images up to this size are hashed in memory, so one that is already
+# in the media folder never touches the disk.
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Threads copying staged media that is on another file system than the media
+# folder, and so can't simply be renamed into it.
+COPY_THREADS = 4
+
+# Bytes of a file hashed at a time.
+CHUNK_SIZE = 1024 * 1024
+
+# Linux ioctl that makes a copy-on-write clone of a file, on file systems
+# that support it like btrfs and xfs.
+FICLONE = 0x40049409
+
+
+class DigestWriter(object):
+    """File-like object that hashes everything written through it."""
+
+    def __init__(self, file_):
+        self.file = file_
+        self.hash = hashlib.sha1()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        self.file.write(data)
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def content_filename(digest, name):
+    """Name a media file after the digest of its content.
+
+    The extension of the original name is kept so Anki and the browser
+    still know what kind of file it is.
+    """
+    return digest + os.path.splitext(name)[1].lower()
+
+
+def store(write, name, exists=None, temp_dir=None, spool_size=SPOOL_SIZE):
+    """Decode a media file through `write` and stage it under its digest.
+
+    Returns a `(filename, path)` tuple. `path` is a temp file in `temp_dir`
+    that should be moved into the media folder as `filename`, or `None` when
+    `exists(filename)` says the file is already there. Files larger than
+    `spool_size` are decoded to disk rather than memory. With a `spool_size`
+    of 0 every file is decoded straight to its temp file, which is removed
+    again if it exists already.
+    """
+    if not spool_size:
+        with NamedTemporaryFile(suffix=os.path.splitext(name)[1],
+                                dir=temp_dir, delete=False) as file_:
+            writer = DigestWriter(file_)
+            try:
+                write(writer)
+            except:
+                file_.close()
+                os.remove(file_.name)
+                raise
+        filename = content_filename(writer.hexdigest(), name)
+        if exists and exists(filename):
+            os.remove(file_.name)
+            return filename, None
+        return filename, file_.name
+
+    with SpooledTemporaryFile(max_size=spool_size) as spool:
+        writer = DigestWriter(spool)
+        write(writer)
+        filename = content_filename(writer.hexdigest(), name)
+        if exists and exists(filename):
+            return filename, None
+
+        spool.seek(0)
+        with NamedTemporaryFile(suffix=filename, dir=temp_dir,
+                                delete=False) as file_:
+            shutil.copyfileobj(spool, file_)
+        return filename, file_.name
+
+
+def store_file(path, name, exists=None, temp_dir=None, hard_link=False):
+    """Stage the media file at `path` under its digest, like `store`.
+
+    The file is only read to hash it. It is staged as a copy-on-write clone
+    where the file system allows, or else copied, see `link`. `hard_link`
+    stages it as a hard link instead, which then changes along with `path`
+    even though its name is the digest of what it held before.
+    """
+    hash_ = hashlib.sha1()
+    with open(path, 'rb') as file_:
+        for chunk in iter(lambda: file_.read(CHUNK_SIZE), ''):
+            hash_.update(chunk)
+    filename = content_filename(hash_.hexdigest(), name)
+    if exists and exists(filename):
+        return filename, None
+
+    handle, temp_path = mkstemp(suffix=filename, dir=temp_dir)
+    os.close(handle)
+    os.remove(temp_path)
+    link(path, temp_path, hard_link)
+    return filename, temp_path
+
+
+def link(source, target, hard=False):
+    """Make `target` a copy-on-write clone of `source`, or else a copy.
+
+    With `hard`, a hard link is tried first. Both names are then the same
+    file, so only use it for files that are never changed in place.
+    """
+    if hard:
+        try:
+            os.link(source, target)
+            return
+        except (AttributeError, OSError):
+            # No hard links on this platform or across file systems.
+            pass
+    if fcntl is not None:
+        try:
+            with open(source, 'rb') as source_file:
+                with open(target, 'wb') as target_file:
+                    fcntl.ioctl(target_file.fileno(), FICLONE,
+                                source_file.fileno())
+            return
+        except (IOError, OSError):
+            pass
+    shutil.copyfile(source, target)
+
+
+def commit(file_map, media_dir, progress=None, threads=COPY_THREADS):
+    """Move the staged media of `file_map` into `media_dir`.
+
+    Media staged on the same file system as `media_dir` is renamed into
+    place, which is atomic and copies nothing. Other files are copied by a
+    pool of `threads`, each to a temp name next to its target first, so
+    `media_dir` never holds a partly written file.
+
+    `progress` is called with the number of files handled so far and may
+    raise to stop. If anything goes wrong, the files moved so far are removed
+    from `media_dir` again and the remaining temp files are discarded, so no
+    half-imported media is left behind.
+    """
+    moved = []
+    copies = []
+    pool = None
+    try:
+        done = 0
+        for meta in file_map.values():
+            if progress:
+                progress(done)
+            temp_path = meta.get('path')
+            if temp_path:
+                new_path = os.path.join(media_dir, meta.get('filename'))
+                if os.path.exists(new_path):
+                    # Media is named after its content, so it's the same.
+                    os.remove(temp_path)
+                    meta['path'] = None
+                elif _rename(temp_path, new_path):
+                    meta['path'] = None
+                    moved.append(new_path)
+                else:
+                    copies.append((meta, new_path))
+                    continue
+            done += 1
+
+        if copies:
+            pool = ThreadPool(threads)
+            for new_path in pool.imap_unordered(
+                    lambda copy: _copy(copy[0], copy[1], moved), copies):
+                done += 1
+                if progress:
+                    progress(done)
+    except:
+        if pool:
+            # Copies that are under way finish before they are rolled back.
+            pool.terminate()
+            pool.join()
+        for path in moved:
+            os.remove(path)
+        discard(file_map)
+        raise
+    if pool:
+        pool.close()
+        pool.join()
+
+
+def _rename(source, target):
+    # Python 2 has no `os.replace`, but the target doesn't exist yet.
+    try:
+        os.rename(source, target)
+    except OSError as error:
+        if error.errno == errno.EXDEV:
+            return False
+        raise
+    return True
+
+
+def _copy(meta, new_path, moved):
+    part_path = os.path.join(
+        os.path.dirname(new_path), '.%s.part' % os.path.basename(new_path))
+    try:
+        shutil.copyfile(meta.get('path'), part_path)
+        os.rename(part_path, new_path)
+    except:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    moved.append(new_path)
+    os.remove(meta.get('path'))
+    meta['path'] = None
+    return new_path
+
+
+def discard(file_map):
+    """Remove the temp files of media that was staged but not committed."""
+    for meta in file_map.values():
+        temp_path = meta.get('path')
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        meta['path'] = None
@@ -0,0 +1,317 @@
+import codecs
+import hashlib
+import json
+import mmap
+import os
+from email.parser import HeaderParser
+from tempfile import SpooledTemporaryFile
+
+from emaildata.text import Text, UTF8_CHARSETS, decoder_for
+
+# Bytes decoded at a time when reading a part from an index or converting
+# its charset.
+CHUNK_SIZE = 64 * 1024
+
+# Indexes of this many files are kept, see `save_index`.
+INDEX_FILES = 256
+
+
+def iter_parts(file_, index=None):
+    """Iterate over the parts of a .mht archive without loading it.
+
+    `email.message_from_file` builds the whole message tree in memory,
+    including every encoded image. This reads the archive line by line and
+    hands out one `Part` at a time. A part's body is only read when the
+    caller asks for it, and whatever the caller leaves unread is skipped
+    before the next part is returned.
+
+    OneNote exports are a flat multipart/related message, so nested
+    multiparts are returned as a single opaque part.
+
+    When `index` is a list, an entry describing each part, including the
+    byte range of its body, is appended to it once the part has been read.
+    See `indexed_parts`.
+    """
+    headers = _read_headers(file_)
+    boundary = headers.get_boundary()
+    if boundary is None:
+        body = _Body(file_, None)
+        yield Part(headers, body)
+        return
+
+    delimiter = '--' + boundary
+    # Skip the preamble.
+    while True:
+        line = file_.readline()
+        if not line or line.rstrip() == delimiter + '--':
+            return
+        if line.rstrip() == delimiter:
+            break
+
+    while True:
+        headers = _read_headers(file_)
+        body = _Body(file_, delimiter)
+        yield Part(headers, body)
+        body.skip()
+        if index is not None:
+            index.append(_entry(headers, body))
+        if body.last:
+            return
+
+
+def indexed_parts(file_path, index):
+    """Iterate over the parts of a .mht archive using an index of it.
+
+    No MIME parsing is done: the archive is mapped into memory and each part
+    is decoded straight from its byte range when it is read.
+    """
+    with open(file_path, 'rb') as file_:
+        data = mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for entry in index:
+                yield IndexedPart(data, entry)
+        finally:
+            data.close()
+
+
+def read_utf8(part, spool_size=None):
+    """Return the body of the text `part` converted to utf-8.
+
+    Without `spool_size` it is returned as a str. Otherwise it is returned
+    as a file positioned at its start, which is only kept in memory up to
+    `spool_size` bytes, so the body is never held as a whole.
+    """
+    if spool_size is None:
+        return Text.to_utf8(part.read(), part.charset)
+    raw = SpooledTemporaryFile(max_size=spool_size)
+    part.copy_to(raw)
+    raw.seek(0)
+    charset = part.charset
+    if not charset or charset.lower() in UTF8_CHARSETS:
+        return raw
+    try:
+        decoder = codecs.getincrementaldecoder(charset)()
+    except LookupError:
+        return raw
+
+    converted = SpooledTemporaryFile(max_size=spool_size)
+    try:
+        for chunk in iter(lambda: raw.read(CHUNK_SIZE), ''):
+            converted.write(decoder.decode(chunk).encode('utf-8'))
+        converted.write(decoder.decode('', final=True).encode('utf-8'))
+    except (UnicodeDecodeError, UnicodeEncodeError):
+        # Like `Text.to_utf8`, text that can't be converted is kept as it is.
+        converted.close()
+        raw.seek(0)
+        return raw
+    raw.close()
+    converted.seek(0)
+    return converted
+
+
+def load_index(file_path, index_dir):
+    """Return the cached index of `file_path`, or `None` if there is none or
+    the file changed since it was made."""
+    path = _index_path(file_path, index_dir)
+    try:
+        with open(path) as file_:
+            cached = json.load(file_)
+    except (IOError, ValueError):
+        return None
+    stat = os.stat(file_path)
+    if cached.get('size') != stat.st_size or \
+            cached.get('mtime') != stat.st_mtime:
+        return None
+    # Its mtime tells `save_index` when it was used last.
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return cached['parts']
+
+
+def save_index(file_path, index_dir, index, max_files=INDEX_FILES):
+    """Cache the index of `file_path`, keyed by its size and mtime.
+
+    Only the indexes of the `max_files` files used last are kept, the
+    others are removed.
+    """
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    stat = os.stat(file_path)
+    with open(_index_path(file_path, index_dir), 'w') as file_:
+        json.dump({
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'parts': index,
+        }, file_)
+    _prune(index_dir, max_files)
+
+
+def _prune(index_dir, max_files):
+    used = []
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        try:
+            used.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    used.sort(reverse=True)
+    for mtime, path in used[max_files:]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Removed by another import in the meantime.
+            pass
+
+
+def _index_path(file_path, index_dir):
+    path = os.path.abspath(file_path)
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    return os.path.join(index_dir, hashlib.sha1(path).hexdigest() + '.json')
+
+
+def _entry(headers, body):
+    encoding = headers.get('Content-Transfer-Encoding') or ''
+    return {
+        'content_type': headers.get_content_type(),
+        'location': headers.get('Content-Location'),
+        'charset': headers.get_content_charset(),
+        'encoding': encoding.strip().lower(),
+        'start': body.start,
+        'end': body.end,
+    }
+
+
+class Part(object):
+    """A single part of a .mht archive whose body has not been read yet."""
+
+    def __init__(self, headers, body):
+        self.headers = headers
+        self._body = body
+
+    @property
+    def content_type(self):
+        return self.headers.get_content_type()
+
+    @property
+    def location(self):
+        return self.headers.get('Content-Location')
+
+    @property
+    def charset(self):
+        return self.headers.get_content_charset()
+
+    @property
+    def encoding(self):
+        encoding = self.headers.get('Content-Transfer-Encoding') or ''
+        return encoding.strip().lower()
+
+    def copy_to(self, file_):
+        """Decode the body into `file_` one line at a time."""
+        decoder = decoder_for(self.encoding)
+        for line in self._body:
+            file_.write(decoder.feed(line))
+        file_.write(decoder.flush())
+
+    def read(self):
+        """Return the decoded body.
+
+        Only use this for parts that are meant to be kept in memory anyway,
+        like the root html.
+        """
+        decoder = decoder_for(self.encoding)
+        data = [decoder.feed(line) for line in self._body]
+        data.append(decoder.flush())
+        return ''.join(data)
+
+
+class IndexedPart(object):
+    """A part of a .mht archive read from its byte range in a mapped file.
+
+    Has the same interface as `Part`.
+    """
+
+    def __init__(self, data, entry):
+        self._data = data
+        self.content_type = entry['content_type']
+        self.location = entry['location']
+        self.charset = entry['charset']
+        self.encoding = entry['encoding']
+        self.start = entry['start']
+        self.end = entry['end']
+
+    def copy_to(self, file_):
+        decoder = decoder_for(self.encoding)
+        for start in xrange(self.start, self.end, CHUNK_SIZE):
+            end = min(start + CHUNK_SIZE, self.end)
+            file_.write(decoder.feed(self._data[start:end]))
+        file_.write(decoder.flush())
+
+    def read(self):
+        decoder = decoder_for(self.encoding)
+        return decoder.feed(self._data[self.start:self.end]) + \
+            decoder.flush()
+
+
+class _Body(object):
+    """Lines of a part's body, up to (not including) the next delimiter.
+
+    `start` and `end` are the byte range of the body in the file. `end` is
+    only known once the body has been read.
+    """
+
+    def __init__(self, file_, delimiter):
+        self._file = file_
+        self._delimiter = delimiter
+        self.done = False
+        self.last = False
+        self.start = file_.tell()
+        self.end = None
+        # A single iterator, so a body that was partly read is skipped from
+        # where the reader stopped.
+        self._lines = self._read()
+
+    def __iter__(self):
+        return self._lines
+
+    def _read(self):
+        previous = None
+        offset = self.start
+        while not self.done:
+            line = self._file.readline()
+            if not line:
+                self.done = self.last = True
+            elif self._delimiter and line.startswith(self._delimiter) \
+                    and line.rstrip() in (self._delimiter,
+                                          self._delimiter + '--'):
+                self.done = True
+                self.last = line.rstrip() == self._delimiter + '--'
+            else:
+                if previous is not None:
+                    yield previous
+                    offset += len(previous)
+                previous = line
+                continue
+            # The line break before a delimiter belongs to the delimiter.
+            if previous is None:
+                self.end = offset
+            else:
+                previous = previous.rstrip('\r\n')
+                self.end = offset + len(previous)
+                yield previous
+
+    def skip(self):
+        for _ in self:
+            pass
+
+
+def _read_headers(file_):
+    lines = []
+    while True:
+        line = file_.readline()
+        if not line or line in ('\n', '\r\n'):
+            break
+        lines.append(line)
+    return HeaderParser().parsestr(''.join(lines))
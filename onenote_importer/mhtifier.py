@@ -6,46 +6,76 @@ Un/packs an MHT "archive" into/from separate files, writing/reading them in dire
 Uses part's Content-Location to name paths, or index.html for the root HTML.
 Content types will be assigned according to registry of MIME types mapping to file name extensions.
 
+Neither direction loads the archive into memory. Unpacking decodes each part
+while it is read and hands the decoded blocks to a small pool of writer
+threads. Packing encodes the files one block at a time straight into the
+archive.
+
 History:
 * 2013-01-11: renamed mhtifier.
 * 2013-01-10: created mht2fs.py, and... done.
 """
 
 # Standard library modules do the heavy lifting. Ours is all simple stuff.
+import argparse
 import base64
-import email
-import email.message
+import binascii
+import email.parser
 import mimetypes
 import os
-import quopri
+import posixpath
 import sys
-import argparse
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Decoded bytes handed to a writer thread at a time.
+BLOCK_SIZE = 1024 * 1024
+
+# Bytes of a file encoded at a time when packing. A multiple of 57, so every
+# base64 line is a full 76 characters.
+PACK_CHUNK_SIZE = 57 * 1024
+
+# Content types OneNote uses that differ from the registry's guess.
+CONTENT_TYPES = {".xml": "text/xml"}
 
 
 def main():
-    """Convert MHT file given as command line argument (or stdin?)
-    to files and directories in the current directory.
+    """Unpack the MHT file given as command line argument (or stdin) into a
+    new directory, or pack a directory into a new MHT file (or stdout).
 
     Usage:
-        cd foo-unpacked/
-        mht2fs.py ../foo.mht
+        mhtifier.py --unpack foo.mht foo-unpacked/
+        mhtifier.py --pack foo-new.mht foo-unpacked/
     """
     parser = argparse.ArgumentParser(
-        description="Extract MHT archive into new directory.")
+        description="Extract MHT archive into new directory, or pack a "
+                    "directory into a new MHT archive.")
     parser.add_argument(
         "mht", metavar="MHT",
         help='path to MHT file, use "-" for stdin/stdout.')
-    # ??? How to make optional, default to current dir?
     parser.add_argument(
         "d", metavar="DIR",
         help="directory to create to store parts in, or read them from.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "-p", "--pack", action="store_true",
+        help="pack the files in DIR into MHT.")
+    group.add_argument(
+        "-u", "--unpack", action="store_true",
+        help="unpack MHT into DIR.")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=min(8, os.cpu_count() or 1),
+        help="number of threads writing unpacked files.")
     parser.add_argument("-v", "--verbose", action="store_true")
     parser.add_argument("-q", "--quiet", action="store_true")
     args = parser.parse_args()  # --help is built-in.
 
     # File name or stdin/stdout?
     if args.mht == "-":
-        mht = sys.stdout if args.pack else sys.stdin.buffer
+        mht = sys.stdout.buffer if args.pack else sys.stdin.buffer
     else:
         if args.pack and os.path.exists(args.mht):
             # Refuse to overwrite MHT file.
@@ -53,48 +83,403 @@ def main():
             sys.exit(-2)
         mht = open(args.mht, "wb" if args.pack else "rb")
 
-    # New directory?
-    if args.unpack:
-        os.mkdir(args.d)
-
-    # Change directory so paths (content-location) are relative to index.html.
-    os.chdir(args.d)
+    log = sys.stderr.write if args.verbose else None
+    started = time.time()
+    try:
+        if args.unpack:
+            if not args.quiet:
+                sys.stderr.write("Unpacking...\n")
+            # New directory.
+            os.mkdir(args.d)
+            parts, bytes_in, bytes_out = unpack(mht, args.d, args.jobs, log)
+        else:
+            if not args.quiet:
+                sys.stderr.write("Packing...\n")
+            parts, bytes_in, bytes_out = pack(args.d, mht, log)
+    finally:
+        if mht not in (sys.stdin.buffer, sys.stdout.buffer):
+            mht.close()
 
     if not args.quiet:
-        sys.stderr.write("Unpacking...\n")
-
-    # Read entire MHT archive -- it's a multipart(/related) message.
-    # Parser is "conducive to incremental parsing of email messages, such as
-    # would be necessary when reading the text of an email message from a
-    # source that can block", so I guess it's more efficient to have it read
-    # stdin directly, rather than buffering.
-    a = email.message_from_bytes(mht.read())
-
-    # Save all parts to files.
-    # walk() for a tree, but I'm guessing MHT is never nested?
-    for p in a.get_payload():
-        # ??? cs = p.get_charset() # Expecting "utf-8" for root HTML,
-        # None for all other parts.
-        # String coerced to lower case of the form maintype/subtype, else
-        # get_default_type().
-        ct = p.get_content_type()
-        # File path. Expecting root HTML is only part with no location.
-        fp = p.get("content-location") or "index.html"
-
-        if args.verbose:
-            sys.stderr.write("Writing %s to %s, %d bytes...\n" %
-                             (ct, fp, len(p.get_payload())))
-
-        # Create directories as necessary.
-        if os.path.dirname(fp):
-            os.makedirs(os.path.dirname(fp), exist_ok=True)
-
-        # Save part's body to a file.
-        open(fp, "wb").write(p.get_payload(decode=True))
+        seconds = max(time.time() - started, 1e-6)
+        sys.stderr.write(
+            "Done.\n%s %d files, %.1f MB in, %.1f MB out in %.2f s "
+            "(%.1f MB/s, %.1f files/s).\n" % (
+                "Unpacked" if args.unpack else "Packed", parts,
+                bytes_in / 1e6, bytes_out / 1e6, seconds,
+                bytes_in / 1e6 / seconds, parts / seconds))
+
+
+def unpack(mht, directory, jobs, log=None):
+    """Write every part of the archive read from the binary file `mht` to
+    `directory`. Returns the number of parts, bytes read and bytes written.
+    """
+    source = _Source(mht)
+    writer = _Writer(jobs)
+    parts = 0
+    root = None
+    used = set()
+    try:
+        for headers, body in iter_parts(source):
+            parts += 1
+            content_type = headers.get_content_type()
+            location = headers.get("content-location")
+            if root is None and content_type == "text/html":
+                # Paths are made relative to the root HTML, so its links
+                # keep working. Expecting it is the only part with no
+                # location.
+                root = posixpath.dirname(_url_path(location or ""))
+            path = _local_path(location, root) or "index.html"
+            if path in used:
+                path = "%d-%s" % (parts, path)
+            used.add(path)
+
+            if log:
+                log("Writing %s to %s...\n" % (content_type, path))
+            path = os.path.join(directory, path)
+            # Create directories as necessary.
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            output = writer.open(path)
+            decoder = _decoder_for(headers.get("content-transfer-encoding"))
+            block = []
+            size = 0
+            for line in body:
+                data = decoder.feed(line)
+                block.append(data)
+                size += len(data)
+                if size >= BLOCK_SIZE:
+                    output.write(b"".join(block))
+                    block = []
+                    size = 0
+            block.append(decoder.flush())
+            output.write(b"".join(block))
+            output.close()
+    finally:
+        writer.close()
+    return parts, source.bytes_read, writer.bytes_written
+
+
+def pack(directory, mht, log=None):
+    """Write the files in `directory` to the binary file `mht` as an
+    archive. The root HTML, index.html or else the first HTML file at the
+    top, comes first. Returns the number of parts, bytes read and bytes
+    written."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.relpath(os.path.join(dirpath, filename), directory)
+            paths.append(path.replace(os.sep, "/"))
+    pages = [path for path in paths
+             if "/" not in path and path.lower().endswith((".htm", ".html"))]
+    if pages:
+        root = "index.html" if "index.html" in pages else pages[0]
+        paths.remove(root)
+        paths.insert(0, root)
+
+    output = _Sink(mht)
+    boundary = "----=_NextPart_" + uuid.uuid4().hex
+    output.write(
+        ("MIME-Version: 1.0\r\n"
+         "Content-Type: multipart/related; boundary=\"%s\"; "
+         "type=\"text/html\"\r\n"
+         "\r\n"
+         "This is a multi-part message in MIME format.\r\n"
+         % boundary).encode("ascii"))
+
+    bytes_read = 0
+    for path in paths:
+        content_type = \
+            CONTENT_TYPES.get(posixpath.splitext(path)[1].lower()) or \
+            mimetypes.guess_type(path)[0] or "application/octet-stream"
+        text = content_type.startswith("text/")
+        if log:
+            log("Reading %s as %s...\n" % (path, content_type))
+        output.write(
+            ("\r\n--%s\r\n"
+             "Content-Location: %s\r\n"
+             "Content-Transfer-Encoding: %s\r\n"
+             "Content-Type: %s\r\n"
+             "\r\n" % (
+                 boundary, urllib.parse.quote(path),
+                 "quoted-printable" if text else "base64", content_type)
+             ).encode("ascii"))
+        with open(os.path.join(directory, path), "rb") as file_:
+            if text:
+                # Line breaks become CRLF, as MIME expects for text.
+                for line in file_:
+                    bytes_read += len(line)
+                    stripped = line.rstrip(b"\r\n")
+                    encoded = binascii.b2a_qp(stripped).replace(
+                        b"\n", b"\r\n")
+                    # A last line without a line break is kept that way.
+                    if stripped != line:
+                        encoded += b"\r\n"
+                    output.write(encoded)
+            else:
+                while True:
+                    chunk = file_.read(PACK_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    bytes_read += len(chunk)
+                    encoded = base64.encodebytes(chunk)
+                    output.write(encoded.replace(b"\n", b"\r\n"))
+    output.write(("\r\n--%s--\r\n" % boundary).encode("ascii"))
+    mht.flush()
+    return len(paths), bytes_read, output.bytes_written
+
+
+def iter_parts(source):
+    """Yield `(headers, body)` for every part of the archive read from the
+    binary file `source`, one at a time.
+
+    `body` iterates over the encoded lines of the part; whatever is left
+    unread is skipped before the next part. MHT is never nested, so nested
+    multiparts come out as a single part.
+    """
+    headers = _read_headers(source)
+    boundary = headers.get_boundary()
+    if boundary is None:
+        yield headers, _Body(source, None)
+        return
+
+    delimiter = b"--" + boundary.encode("ascii")
+    # Skip the preamble.
+    while True:
+        line = source.readline()
+        if not line or line.rstrip() == delimiter + b"--":
+            return
+        if line.rstrip() == delimiter:
+            break
+
+    while True:
+        headers = _read_headers(source)
+        body = _Body(source, delimiter)
+        yield headers, body
+        body.skip()
+        if body.last:
+            return
+
+
+class _Body:
+    """Encoded lines of a part, up to (not including) the next delimiter."""
+
+    def __init__(self, source, delimiter):
+        self._lines = self._read(source, delimiter)
+        self.last = False
+
+    def __iter__(self):
+        return self._lines
+
+    def _read(self, source, delimiter):
+        previous = None
+        while True:
+            line = source.readline()
+            if not line:
+                self.last = True
+            elif delimiter and line.startswith(delimiter) \
+                    and line.rstrip() in (delimiter, delimiter + b"--"):
+                self.last = line.rstrip() == delimiter + b"--"
+            else:
+                if previous is not None:
+                    yield previous
+                previous = line
+                continue
+            # The line break before a delimiter belongs to the delimiter.
+            if previous is not None:
+                yield previous.rstrip(b"\r\n")
+            return
+
+    def skip(self):
+        for _ in self:
+            pass
+
+
+def _read_headers(source):
+    lines = []
+    while True:
+        line = source.readline()
+        if not line or line in (b"\n", b"\r\n"):
+            break
+        lines.append(line)
+    return email.parser.BytesHeaderParser().parsebytes(b"".join(lines))
+
+
+class _Decoder:
+    """Passes 7bit, 8bit and binary bodies through."""
+
+    def feed(self, data):
+        return data
+
+    def flush(self):
+        return b""
+
+
+class _Base64Decoder(_Decoder):
+    def __init__(self):
+        self.pending = b""
+
+    def feed(self, data):
+        # Only whole groups of 4 characters can be decoded.
+        data = self.pending + b"".join(data.split())
+        usable = len(data) - len(data) % 4
+        self.pending = data[usable:]
+        return binascii.a2b_base64(data[:usable])
+
+    def flush(self):
+        data, self.pending = self.pending, b""
+        if not data:
+            return b""
+        return binascii.a2b_base64(data + b"=" * (-len(data) % 4))
+
+
+class _QuotedPrintableDecoder(_Decoder):
+    # Bodies are fed whole lines, and a soft line break never spans two.
+    def feed(self, data):
+        return binascii.a2b_qp(data)
+
+
+def _decoder_for(encoding):
+    encoding = (encoding or "").strip().lower()
+    if encoding == "base64":
+        return _Base64Decoder()
+    if encoding == "quoted-printable":
+        return _QuotedPrintableDecoder()
+    return _Decoder()
+
+
+def _url_path(location):
+    return urllib.parse.unquote(urllib.parse.urlparse(location).path)
+
+
+def _local_path(location, root):
+    """Return the relative path to write the part at `location` to, or None.
+
+    Locations under the root HTML's directory keep their place relative to
+    it. Drive letters and `..` are dropped, so nothing is written outside
+    the directory.
+    """
+    if not location:
+        return None
+    path = _url_path(location.replace("\\", "/"))
+    if root and path.startswith(root + "/"):
+        path = path[len(root) + 1:]
+    names = [name for name in path.split("/")
+             if name not in ("", ".", "..") and not name.endswith(":")]
+    return os.path.join(*names) if names else None
+
+
+class _Source:
+    """Counts the bytes read from a binary file."""
+
+    def __init__(self, file_):
+        self._file = file_
+        self.bytes_read = 0
+
+    def readline(self):
+        line = self._file.readline()
+        self.bytes_read += len(line)
+        return line
+
+
+class _Sink:
+    """Counts the bytes written to a binary file."""
+
+    def __init__(self, file_):
+        self._file = file_
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+
+class _Writer:
+    """Writes blocks to files from a bounded pool of threads.
+
+    At most two blocks per thread are waiting to be written, so reading
+    never gets far ahead of the disk.
+    """
+
+    def __init__(self, jobs):
+        self._pool = ThreadPoolExecutor(max(jobs, 1))
+        self._slots = threading.BoundedSemaphore(max(jobs, 1) * 2)
+        self._lock = threading.Lock()
+        self._error = None
+        self.bytes_written = 0
+
+    def open(self, path):
+        return _Output(self, path)
+
+    def submit(self, function, *args):
+        self._check()
+        self._slots.acquire()
+        future = self._pool.submit(function, *args)
+        future.add_done_callback(self._done)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self._check()
+
+    def wrote(self, size):
+        with self._lock:
+            self.bytes_written += size
+
+    def _done(self, future):
+        self._slots.release()
+        with self._lock:
+            if future.exception() is not None and self._error is None:
+                self._error = future.exception()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+
+class _Output:
+    """A file written by `_Writer`. Blocks may be written in any order, as
+    each goes to its own offset."""
+
+    def __init__(self, writer, path):
+        self._writer = writer
+        self._file = open(path, "wb")
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._pending = 0
+        self._closing = False
+
+    def write(self, block):
+        if not block:
+            return
+        with self._lock:
+            self._pending += 1
+        try:
+            self._writer.submit(self._write, self._offset, block)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self._offset += len(block)
+
+    def close(self):
+        with self._lock:
+            self._closing = True
+            if not self._pending:
+                self._file.close()
+
+    def _write(self, offset, block):
+        with self._lock:
+            try:
+                self._file.seek(offset)
+                self._file.write(block)
+                self._writer.wrote(len(block))
+            finally:
+                self._pending -= 1
+                if self._closing and not self._pending:
+                    self._file.close()
 
-    if not args.quiet:
-        sys.stderr.write("Done.\nUnpacked %d files.\n" %
-                         (len(a.get_payload())))
 
 if __name__ == "__main__":
     main()  # Kindda useless if we're not using doctest or anything?
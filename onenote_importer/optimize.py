@@ -0,0 +1,153 @@
+import os
+import sqlite3
+from multiprocessing.pool import ThreadPool
+from tempfile import NamedTemporaryFile
+
+try:
+    from PIL import Image
+    # Renamed in newer versions of Pillow.
+    _RESAMPLE = getattr(Image, 'LANCZOS', None) or Image.ANTIALIAS
+except ImportError:
+    Image = None
+
+import media
+
+
+class Optimizer(object):
+    """Downscales and re-encodes imported images with Pillow.
+
+    OneNote exports screenshots as full resolution PNGs. Images larger than
+    `max_dimension` are scaled down, and every image is re-encoded, either
+    losslessly as an optimized PNG or, with `lossy`, as a JPEG of `quality`.
+    A scaled down image is always kept, even if its file got larger.
+    Otherwise the smaller of the original and the result is kept.
+
+    Images are optimized in a pool of `threads`, as Pillow does the heavy
+    work without holding the GIL. Results are remembered by the digest of
+    the original in the sqlite file at `cache_path`, so repeat imports of an
+    image that is already in the media folder skip the work.
+
+    Without Pillow installed images are left as they are.
+    """
+
+    def __init__(self, max_dimension=1600, lossy=False, quality=85,
+                 threads=None, cache_path=None):
+        self.max_dimension = max_dimension
+        self.lossy = lossy
+        self.quality = quality
+        self.threads = threads
+        self.cache_path = cache_path
+        self._pool = None
+        self._db = None
+
+    def __getstate__(self):
+        # Sent to worker processes without the pool or the connection.
+        state = self.__dict__.copy()
+        state['_pool'] = state['_db'] = None
+        return state
+
+    @property
+    def settings(self):
+        return '%d:%s:%d' % (self.max_dimension, self.lossy, self.quality)
+
+    def submit(self, path, filename):
+        """Start optimizing the staged file `path` named `filename`.
+
+        Returns an `AsyncResult` whose `get()` is the `(filename, path)` of
+        the file to import instead.
+        """
+        if self._pool is None:
+            self._pool = ThreadPool(self.threads)
+        return self._pool.apply_async(self.optimize, (path, filename))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def cached(self, filename):
+        """Return the name of the optimized version of `filename` if it was
+        made before with the same settings, else `None`."""
+        if not self.cache_path:
+            return None
+        found = self._connect().execute(
+            'select filename from media where source = ? and settings = ?',
+            (filename, self.settings)).fetchone()
+        return found[0] if found else None
+
+    def optimize(self, path, filename):
+        if Image is None:
+            return filename, path
+        try:
+            return self._optimize(path, filename)
+        except Exception:
+            # Not an image Pillow can read, or one it fails on. It is
+            # imported as it is.
+            return filename, path
+
+    def _optimize(self, path, filename):
+        image = Image.open(path)
+        image.load()
+
+        size = image.size
+        image.thumbnail((self.max_dimension, self.max_dimension), _RESAMPLE)
+        resized = image.size != size
+        if self.lossy and image.mode not in ('RGBA', 'LA', 'P'):
+            extension, options = '.jpg', dict(format='JPEG', optimize=True,
+                                              quality=self.quality)
+            image = image.convert('RGB')
+        else:
+            # Images with transparency stay PNGs even when lossy.
+            extension, options = '.png', dict(format='PNG', optimize=True)
+
+        with NamedTemporaryFile(suffix=extension, delete=False,
+                                dir=os.path.dirname(path)) as file_:
+            try:
+                writer = media.DigestWriter(file_)
+                image.save(writer, **options)
+            except:
+                file_.close()
+                os.remove(file_.name)
+                raise
+
+        if not resized and writer.size >= os.path.getsize(path):
+            os.remove(file_.name)
+            return filename, path
+
+        optimized = writer.hexdigest() + extension
+        self._remember(filename, optimized)
+        # The original is only removed once nothing can fail anymore.
+        os.remove(path)
+        return optimized, file_.name
+
+    def _remember(self, filename, optimized):
+        if not self.cache_path:
+            return
+        try:
+            # Pool threads each get their own connection.
+            db = sqlite3.connect(self.cache_path, timeout=30)
+            try:
+                _create(db)
+                db.execute('insert or replace into media values (?, ?, ?)',
+                           (filename, self.settings, optimized))
+                db.commit()
+            finally:
+                db.close()
+        except sqlite3.Error:
+            # E.g. locked by an import's `RowStore`. The image is optimized
+            # again next time, which is all the cache saves.
+            pass
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.cache_path, timeout=30)
+            _create(self._db)
+        return self._db
+
+
+def _create(db):
+    db.execute(
+        'create table if not exists media ('
+        'source text not null, settings text not null, '
+        'filename text not null, primary key (source, settings))')
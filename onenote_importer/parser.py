@@ -1,81 +1,360 @@
 import os
 import mimetypes
+import urllib
 import urlparse
 import email
-from datetime import datetime
-from tempfile import NamedTemporaryFile
 
-from BeautifulSoup import BeautifulSoup
 from emaildata.text import Text
 from emaildata.attachment import Attachment
+import backends
+import mht
+import media
+import sources
+from stats import Stats
+
+
+# What can be done with tables inside table cells, see `Parser`.
+NESTED_TABLE_POLICIES = ('inline', 'separate', 'skip')
 
 
 class Parser(object):
-    def __init__(self, file_path):
-        with open(file_path) as file_:
-            self.message = email.message_from_file(file_)
-        html, content_location = Text.html(self.message)
-        url = urlparse.urlparse(content_location)
-        self.root = os.path.dirname(url.path)
-        self.soup = BeautifulSoup(html)
-        self.date_hash = datetime.today().strftime("%Y-%m-%d-%H-%M-%S_")
+    """Turns the tables of a .mht export into `(question, answer)` rows.
+
+    Text is kept as utf-8 encoded str from the decoded page to the rows;
+    a page in another charset is converted once when it is read. The rows
+    are only decoded, once, when Anki's notes are made from them.
+    """
+
+    def __init__(self, file_path, streaming=False, media_dir=None,
+                 backend=None, progress=None, temp_dir=None, optimizer=None,
+                 referenced_only=False, index_dir=None, tables=None,
+                 nested_tables='inline', memory_budget=None,
+                 link_media=False):
+        self.source = os.path.abspath(file_path)
+        # See `backends` for the html libraries that can be used.
+        self.backend = backends.get(backend)
+        # Indexes of the tables to render, see `census`. `None` renders all
+        # of them.
+        self.tables = tables
+        # What to do with a table inside a cell of another one: render it
+        # 'inline' as part of the cell, render its rows as 'separate' cards,
+        # or 'skip' it. Each table is rendered once either way.
+        if nested_tables not in NESTED_TABLE_POLICIES:
+            raise ValueError('Unknown nested_tables: %r' % nested_tables)
+        self.nested_tables = nested_tables
+        self.selected = None
+        # Bytes of the page or of a single image that may be held in memory
+        # before they are spooled to disk. Setting it also reads the file
+        # part by part, as with `streaming`, and frees every table once its
+        # rows are rendered, so the rows can only be rendered once.
+        self.memory_budget = memory_budget
+        # Only stage the media that images in the tables refer to. Other
+        # parts are skipped without decoding them.
+        self.referenced_only = referenced_only
+        self.referenced = None
+        self.media_dir = media_dir
+        # Where media is staged, the system's temp folder by default.
+        self.temp_dir = temp_dir
+        # Hard link the images of a folder, see `media.store_file`, rather
+        # than cloning or copying them.
+        self.link_media = link_media
+        # Optional `optimize.Optimizer` that images are run through before
+        # they are imported.
+        self.optimizer = optimizer
+        self.pending = {}
+        # Where the byte offsets of each file's parts are cached, so reading
+        # it again skips the MIME parsing. Only used when streaming.
+        self.index_dir = index_dir
+        # Called with the number of bytes read and rows rendered so far. It
+        # may raise to stop parsing, e.g. `progress.Cancelled`.
+        self.progress = progress
+        self.bytes_read = 0
+        self.stats = Stats()
         self.file_map = {}
+        self.staged = set()
+        self.message = None
+        self.document = None
+
+        try:
+            with self.stats.timer('mime_parse'):
+                if sources.is_export(file_path):
+                    # A folder or zip file, see `sources`.
+                    self._ingest_export(file_path)
+                elif streaming or memory_budget:
+                    # Only the root html is kept in memory. Every other part
+                    # is written to disk as soon as it has been decoded.
+                    self._ingest(file_path)
+                else:
+                    with open(file_path) as file_:
+                        self.message = email.message_from_file(file_)
+                        self._report(file_.tell())
+            self.stats.count('bytes_read', self.bytes_read)
+            if self.document is None:
+                self._load(*Text.html(self.message))
+        except:
+            self.discard()
+            raise
+
+    def rows(self):
+        """Return a `(question, answer)` tuple for every table row.
+
+        The rows of a file are handed on as a whole, to Anki's importer or
+        to the output of the command line.
+        """
+        return list(self.iter_rows())
+
+    def iter_rows(self):
+        """Yield a `(question, answer)` tuple for every table row.
+
+        Rows are rendered one at a time, so only the row being yielded is
+        kept in memory besides the page itself.
+        """
+        try:
+            for row in self._rows():
+                yield row
+        except Exception:
+            self.discard()
+            raise
+
+    def discard(self):
+        """Remove the temp files of the media staged so far."""
+        self._wait_for_media()
+        media.discard(self.file_map)
+
+    def _rows(self):
+        # Create a file for every image found in the .mht. When streaming
+        # this has already been done while reading the file.
+        if self.message is not None:
+            with self.stats.timer('extract_media'):
+                # Payloads are decoded in chunks straight into the staged
+                # file, never as a whole.
+                for content, filename, mimetype, message\
+                        in Attachment.extract(self.message, False, False):
+                    self._stage(message.get('Content-Location'), mimetype,
+                                lambda file_: Text.decode_content_to(
+                                    message, file_))
+
+        if self.optimizer:
+            with self.stats.timer('optimize_media'):
+                self._wait_for_media()
+
+        # Rendering time includes whatever the consumer does between rows.
+        with self.stats.timer('render_rows'):
+            for row in self._render():
+                yield row
+
+    def _render(self):
+        # Replace `src` on every image so it works in Anki. Images without
+        # media, e.g. outside the tables when only referenced media is
+        # staged, are left alone.
+        document = self.document
+        tables = self._tables()
+        for table in tables:
+            for img in document.images(table):
+                meta = self.file_map.get(self._image_path(img))
+                if not meta:
+                    continue
+                document.set(img, 'src', meta.get('filename'))
+
+                # Make sure it stretches in anki on resizing
+                document.set(img, 'width', 'auto')
+                document.set(img, 'height', 'auto')
+
+        count = 0
+        for position, table in enumerate(tables):
+            self.stats.count('tables')
+            for row in document.rows(table):
+                tds = document.cells(row, limit=2)
+                if len(tds) < 2:
+                    # E.g. a heading spanning both columns has no back side.
+                    self.stats.count('rows_skipped')
+                    continue
+                self.stats.count('rows')
+                question = self._strip_newlines(document.render(tds[0]))
+                answer = self._strip_newlines(document.render(tds[1]))
+                count += 1
+                self._report(rows=count)
+                yield question, answer
+            if self.memory_budget:
+                # Its rows are out, so the table is not needed anymore.
+                tables[position] = None
+                document.release(table)
+        if self.memory_budget:
+            self.document = None
+
+    def _report(self, bytes_read=None, rows=0):
+        if bytes_read is not None:
+            self.bytes_read = bytes_read
+        if self.progress:
+            self.progress(self.bytes_read, rows)
+
+    def _load(self, html, content_location):
+        url = urlparse.urlparse(content_location)
+        self.root = os.path.dirname(urllib.unquote(url.path))
+        with self.stats.timer('html_parse'):
+            self.document = self.backend(html)
+        if not isinstance(html, basestring):
+            html.close()
+        if self.referenced_only:
+            document = self.document
+            self.referenced = set(
+                self._image_path(img)
+                for table in self._tables()
+                for img in document.images(table))
+
+    def _tables(self):
+        # The tables to render, in document order. Nested tables that are
+        # not rendered inline are taken out of the cell they are in, so no
+        # element is rendered twice.
+        if self.selected is not None:
+            return self.selected
+        document = self.document
+        self.selected = []
+        for index, (table, nested) in enumerate(document.walk_tables()):
+            if nested:
+                if self.nested_tables == 'inline':
+                    continue
+                document.remove(table)
+                if self.nested_tables == 'skip':
+                    continue
+            if self.tables is None or index in self.tables:
+                self.selected.append(table)
+        return self.selected
+
+    def _ingest(self, file_path):
+        index = None
+        if self.index_dir:
+            index = mht.load_index(file_path, self.index_dir)
+        if index is not None:
+            # Parts are read straight from their offsets in the file.
+            self.stats.count('index_hits')
+            for part in mht.indexed_parts(file_path, index):
+                self._ingest_part(part)
+                self._report(part.end)
+            self._report(os.path.getsize(file_path))
+            return
+
+        index = [] if self.index_dir else None
+        with open(file_path, 'rb') as file_:
+            for part in mht.iter_parts(file_, index):
+                self._ingest_part(part)
+                self._report(file_.tell())
+            # Whatever follows the last part is not read.
+            self._report(os.fstat(file_.fileno()).st_size)
+        if index is not None:
+            mht.save_index(file_path, self.index_dir, index)
+
+    def _ingest_export(self, file_path):
+        for part in sources.iter_parts(file_path):
+            self._ingest_part(part)
+            self._report(self.bytes_read + part.size)
+
+    def _ingest_part(self, part):
+        if self.document is None and part.content_type == 'text/html':
+            # The page is parsed right away, so when only referenced media
+            # is staged the parts after it can be skipped. OneNote puts the
+            # page first.
+            self._load(mht.read_utf8(part, self.memory_budget),
+                       part.location)
+        else:
+            self._stage(part.location, part.content_type, part.copy_to,
+                        getattr(part, 'path', None))
+
+    def _stage(self, url, mimetype, write, source=None):
+        extension = mimetypes.guess_extension(mimetype)
+
+        # The .mht onenote export contains a .htm file with the content
+        # and a .xml file with path structure. Ignore these.
+        if extension in ['.htm', '.xml']:
+            return
+
+        path = urllib.unquote(urlparse.urlparse(url).path)
+        path = os.path.normpath(path)
+
+        # Don't create if a similar file is already saved
+        if self.file_map.get(path):
+            return
+
+        if self.referenced is not None and path not in self.referenced:
+            self.stats.count('parts_skipped')
+            return
+
+        # Media is named after its content, so an image that is already in
+        # the media folder from an earlier import is only hashed. Otherwise
+        # a temp file is created which is later moved to the
+        # collection.media folder as `filename`. Media that is a file already
+        # is cloned rather than decoded.
+        if source:
+            filename, temp_path = media.store_file(
+                source, os.path.basename(path), self._exists, self.temp_dir,
+                self.link_media)
+            self.stats.count('parts_linked')
+        else:
+            spool_size = media.SPOOL_SIZE
+            if self.message is not None:
+                # The whole encoded export is in memory already, so decoded
+                # media goes straight to disk rather than next to it.
+                spool_size = 0
+            elif self.memory_budget:
+                spool_size = min(spool_size, self.memory_budget)
+            filename, temp_path = media.store(
+                write, os.path.basename(path), self._exists, self.temp_dir,
+                spool_size)
+            self.stats.count('parts_decoded')
+        self.stats.count('images_written' if temp_path else 'images_deduped')
+        if not temp_path:
+            filename = self._optimized(filename)
+        self.staged.add(filename)
+        self.file_map[path] = {
+            'filename': filename,
+            'path': temp_path,
+        }
+        if temp_path and self.optimizer:
+            self.pending[path] = self.optimizer.submit(temp_path, filename)
+
+    def _exists(self, filename):
+        # Whether media named `filename`, or its optimized version, is
+        # already staged or in the media folder.
+        filename = self._optimized(filename)
+        if filename in self.staged:
+            return True
+        return bool(self.media_dir) and \
+            os.path.exists(os.path.join(self.media_dir, filename))
+
+    def _optimized(self, filename):
+        if self.optimizer:
+            return self.optimizer.cached(filename) or filename
+        return filename
+
+    def _wait_for_media(self):
+        # Collect the images that are still being optimized.
+        for path, result in self.pending.items():
+            filename, temp_path = result.get()
+            self.staged.add(filename)
+            self.file_map[path] = {
+                'filename': filename,
+                'path': temp_path,
+            }
+            del self.pending[path]
+        if self.optimizer:
+            self.optimizer.close()
 
-    def run(self):
-        # Create a file for every image found in the .mht.
-        for content, filename, mimetype, message\
-                in Attachment.extract(self.message, False):
-
-            extension = mimetypes.guess_extension(mimetype)
-
-            # The .mht onenote export contains a .htm file with the content
-            # and a .xml file with path structure. Ignore these.
-            if extension in ['.htm', '.xml']:
-                continue
-
-            # Create a unique filename
-            url = message.get('Content-Location')
-            path = urlparse.urlparse(url).path
-            path = os.path.normpath(path)
-            filename = os.path.basename(path)
-            filename = self.date_hash + filename
-
-            # Don't create if a similar file is already saved
-            if self.file_map.get(path):
-                continue
-
-            # Create a temp file which is later moved to the collection.media
-            # folder. `filename` is the name it will eventually be called.
-            with NamedTemporaryFile(suffix=filename, delete=False) as file_:
-                file_.write(content)
-                self.file_map[path] = {
-                    'filename': filename,
-                    'path': file_.name,
-                }
-
-        # Replace `src` on every image so it works in Anki.
-        for img in self.soup.findAll('img'):
-            path = self._get_absolute_path_from_relative_path(img.get('src'))
-            path = os.path.normpath(path)
-            new_src = self.file_map.get(path).get('filename')
-            img['src'] = new_src
-
-            # Make sure it stretches in anki on resizing
-            img['width'] = 'auto'
-            img['height'] = 'auto'
-
-        # Build the format that the Anki importer can parse.
-        output = ''
-        for table  in self.soup.findAll('table'):
-            for row in table.findAll('tr', recursive=False):
-                tds = [td for td in row.findAll(recursive=False, limit=2)]
-                question = self._strip_newlines(tds[0].renderContents())
-                answer = self._strip_newlines(tds[1].renderContents())
-                output += '%s\t%s\n' % (question, answer)
-        return output
+    def _image_path(self, img):
+        src = self.document.get(img, 'src')
+        if not src:
+            return None
+        if isinstance(src, unicode):
+            src = src.encode('utf-8')
+        # Locations are unquoted in `_stage` too, so both forms match.
+        src = urllib.unquote(src)
+        return os.path.normpath(
+            self._get_absolute_path_from_relative_path(src))
 
     def _get_absolute_path_from_relative_path(self, relative_path):
         return os.path.join(self.root, relative_path)
 
     def _strip_newlines(self, string):
+        # `replace` returns the string itself when there is nothing to
+        # replace, so cells without line breaks are not copied. It is also
+        # faster than a single `translate` pass, see benchmarks/text.py.
         return string.replace('\n', '').replace('\r', '')
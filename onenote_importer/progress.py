@@ -0,0 +1,46 @@
+import time
+
+
+class Cancelled(Exception):
+    """Raised by `Progress.update` once the user has cancelled."""
+
+
+class Progress(object):
+    """Progress of a task running in another thread.
+
+    The task calls `update` as it goes and the GUI reads the attributes to
+    show them. Attributes are only ever replaced, never mutated, so no lock
+    is needed.
+    """
+
+    def __init__(self, total):
+        # In bytes for parsing, or in files for copying media.
+        self.total = total
+        self.done = 0
+        self.rows = 0
+        self.started = time.time()
+        self.cancelled = False
+
+    def update(self, done=None, rows=None):
+        if self.cancelled:
+            raise Cancelled()
+        if done is not None:
+            self.done = done
+        if rows is not None:
+            self.rows = rows
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fraction(self):
+        if not self.total:
+            return 0.0
+        return min(float(self.done) / self.total, 1.0)
+
+    def eta(self):
+        """Seconds left, estimated from the rate so far, or `None`."""
+        fraction = self.fraction()
+        if not fraction:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed / fraction - elapsed
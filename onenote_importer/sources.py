@@ -0,0 +1,148 @@
+"""Exports that are not a .mht: a folder it was unpacked to, e.g. by
+`mhtifier.py` or as "Web page, complete", or a zip file of such a folder.
+
+`iter_parts` hands out their files as parts with the interface of
+`mht.Part`, so `Parser` reads them like a .mht. Nothing needs MIME
+decoding, and images in a folder have their `path` set, so they can be
+cloned into the media folder rather than decoded.
+"""
+import mimetypes
+import os
+import re
+import shutil
+import urllib
+import zipfile
+
+# Bytes copied at a time from a zip member.
+CHUNK_SIZE = 64 * 1024
+
+# Bytes at the start of a page searched for the charset it declares.
+SNIFF_SIZE = 4096
+
+_CHARSET = re.compile(r'''<meta[^>]+charset\s*=\s*["']?([\w-]+)''', re.I)
+
+_PAGES = ('.htm', '.html')
+
+# Types OneNote gives parts that `mimetypes` guesses differently. The page's
+# filelist.xml must be text/xml, so `Parser` skips it like in a .mht.
+CONTENT_TYPES = {'.xml': 'text/xml'}
+
+
+def is_export(path):
+    """Whether `path` is a folder or zip file `iter_parts` can read."""
+    return os.path.isdir(path) or (
+        os.path.isfile(path) and zipfile.is_zipfile(path))
+
+
+def size(path):
+    """Bytes in the export at `path`, which may be a folder."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(dirpath, filename))
+               for dirpath, dirnames, filenames in os.walk(path)
+               for filename in filenames)
+
+
+def iter_parts(path):
+    """Iterate over the files of the folder or zip file at `path`.
+
+    The page comes first: index.html, or else the html file closest to the
+    top. Every part's location is its path relative to the export, so the
+    page's relative image links resolve to them.
+    """
+    if os.path.isdir(path):
+        names = []
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                name = os.path.relpath(os.path.join(dirpath, filename), path)
+                names.append(name.replace(os.sep, '/'))
+        for name in _ordered(names):
+            yield FilePart(os.path.join(path, *name.split('/')), name)
+        return
+
+    archive = zipfile.ZipFile(path)
+    try:
+        members = dict((info.filename, info) for info in archive.infolist()
+                       if not info.filename.endswith('/'))
+        for name in _ordered(members):
+            yield ZipPart(archive, members[name])
+    finally:
+        archive.close()
+
+
+class _SourcePart(object):
+    encoding = 'binary'
+    # A file on disk with the part's content, if there is one.
+    path = None
+
+    def __init__(self, name, size):
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        self.location = urllib.quote(name)
+        self.size = size
+        self.content_type = _content_type(name)
+        self.charset = None
+
+    def _sniff(self, head):
+        # Saved pages declare their charset in a <meta> tag.
+        if self.content_type == 'text/html':
+            match = _CHARSET.search(head)
+            if match:
+                self.charset = match.group(1).lower()
+
+
+class FilePart(_SourcePart):
+    """A file of an unpacked export."""
+
+    def __init__(self, path, name):
+        _SourcePart.__init__(self, name, os.path.getsize(path))
+        self.path = path
+        if self.content_type == 'text/html':
+            with open(path, 'rb') as file_:
+                self._sniff(file_.read(SNIFF_SIZE))
+
+    def copy_to(self, file_):
+        with open(self.path, 'rb') as source:
+            shutil.copyfileobj(source, file_)
+
+    def read(self):
+        with open(self.path, 'rb') as file_:
+            return file_.read()
+
+
+class ZipPart(_SourcePart):
+    """A member of a zipped export."""
+
+    def __init__(self, archive, info):
+        _SourcePart.__init__(self, info.filename, info.file_size)
+        self._archive = archive
+        self._info = info
+        if self.content_type == 'text/html':
+            with archive.open(info) as member:
+                self._sniff(member.read(SNIFF_SIZE))
+
+    def copy_to(self, file_):
+        with self._archive.open(self._info) as member:
+            shutil.copyfileobj(member, file_, CHUNK_SIZE)
+
+    def read(self):
+        return self._archive.read(self._info)
+
+
+def _ordered(names):
+    names = list(names)
+    pages = [name for name in names if name.lower().endswith(_PAGES)]
+    if pages:
+        page = min(pages, key=lambda name: (
+            name.count('/'), os.path.basename(name).lower() != 'index.html',
+            name))
+        names.remove(page)
+        names.insert(0, page)
+    return names
+
+
+def _content_type(name):
+    extension = os.path.splitext(name)[1].lower()
+    return (CONTENT_TYPES.get(extension) or mimetypes.guess_type(name)[0] or
+            'application/octet-stream')
@@ -0,0 +1,50 @@
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Stats(object):
+    """Counters and per-phase timers of an import.
+
+    Cheap enough to always be on: a counter is a dict update and a phase
+    costs two calls to `time.time`. Stats of several files, e.g. parsed in
+    worker processes, are combined with `merge`.
+    """
+
+    def __init__(self):
+        self.counters = OrderedDict()
+        self.seconds = OrderedDict()
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.seconds[name] = \
+                self.seconds.get(name, 0.0) + time.time() - start
+
+    def merge(self, other):
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def summary(self):
+        lines = []
+        for name, amount in self.counters.items():
+            lines.append('%s: %d' % (name.replace('_', ' '), amount))
+        for name, seconds in self.seconds.items():
+            lines.append('%s: %.2fs' % (name.replace('_', ' '), seconds))
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'counters': self.counters, 'seconds': self.seconds}
+
+    def dump(self, path):
+        with open(path, 'w') as file_:
+            json.dump(self.to_dict(), file_, indent=2)
@@ -0,0 +1,67 @@
+import hashlib
+import sqlite3
+
+
+class RowStore(object):
+    """Remembers which rows of an export have already been imported.
+
+    Rows are keyed by the source file and a fingerprint of their front side,
+    which is also what Anki uses to find the note to update. A second
+    fingerprint of the whole row tells whether the row was edited since the
+    last import.
+
+    Changes are kept in a transaction until `commit` is called, so an import
+    that is cancelled leaves the store as it was.
+    """
+
+    NEW, CHANGED, UNCHANGED = 'new', 'changed', 'unchanged'
+
+    def __init__(self, path):
+        self.skipped = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'create table if not exists rows ('
+            'source text not null, key text not null, '
+            'fingerprint text not null, primary key (source, key))')
+
+    def check(self, source, question, answer):
+        """Compare a row with the last import and record it.
+
+        Returns `NEW`, `CHANGED` or `UNCHANGED`.
+        """
+        key = _digest(question)
+        fingerprint = _digest(question, answer)
+        found = self.db.execute(
+            'select fingerprint from rows where source = ? and key = ?',
+            (source, key)).fetchone()
+        if found and found[0] == fingerprint:
+            return self.UNCHANGED
+
+        self.db.execute(
+            'insert or replace into rows values (?, ?, ?)',
+            (source, key, fingerprint))
+        return self.CHANGED if found else self.NEW
+
+    def filter(self, source, rows):
+        """Yield the `(question, answer)` rows of `source` that are new or
+        changed. Unchanged rows are counted in `skipped`."""
+        for question, answer in rows:
+            if self.check(source, question, answer) == self.UNCHANGED:
+                self.skipped += 1
+                continue
+            yield question, answer
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        # Anything that was not committed is rolled back.
+        self.db.close()
+
+
+def _digest(*strings):
+    hash_ = hashlib.sha1()
+    for string in strings:
+        hash_.update(string)
+        hash_.update('\0')
+    return hash_.hexdigest()
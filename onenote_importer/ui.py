@@ -25,7 +25,7 @@ except AttributeError:
 class Ui_MHTImportDialog(object):
     def setupUi(self, MHTImportDialog):
         MHTImportDialog.setObjectName(_fromUtf8("MHTImportDialog"))
-        MHTImportDialog.resize(400, 150)
+        MHTImportDialog.resize(400, 350)
         self.vboxlayout = QtGui.QVBoxLayout(MHTImportDialog)
         self.vboxlayout.setObjectName(_fromUtf8("vboxlayout"))
         self.groupBox = QtGui.QGroupBox(MHTImportDialog)
@@ -42,6 +42,18 @@ class Ui_MHTImportDialog(object):
         self.gridLayout_2.addWidget(self.label_2, 0, 0, 1, 1)
         self.toplayout.addLayout(self.gridLayout_2)
         self.vboxlayout.addWidget(self.groupBox)
+        self.tablesBox = QtGui.QGroupBox(MHTImportDialog)
+        self.tablesBox.setObjectName(_fromUtf8("tablesBox"))
+        self.tablesLayout = QtGui.QVBoxLayout(self.tablesBox)
+        self.tablesLayout.setObjectName(_fromUtf8("tablesLayout"))
+        self.censusLabel = QtGui.QLabel(self.tablesBox)
+        self.censusLabel.setWordWrap(True)
+        self.censusLabel.setObjectName(_fromUtf8("censusLabel"))
+        self.tablesLayout.addWidget(self.censusLabel)
+        self.tablesList = QtGui.QListWidget(self.tablesBox)
+        self.tablesList.setObjectName(_fromUtf8("tablesList"))
+        self.tablesLayout.addWidget(self.tablesList)
+        self.vboxlayout.addWidget(self.tablesBox)
         self.buttonBox = QtGui.QDialogButtonBox(MHTImportDialog)
         self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
         self.buttonBox.setStandardButtons(QtGui.QDialogButtonBox.Close)
@@ -52,11 +64,13 @@ class Ui_MHTImportDialog(object):
         QtCore.QObject.connect(self.buttonBox, QtCore.SIGNAL(_fromUtf8("accepted()")), MHTImportDialog.accept)
         QtCore.QObject.connect(self.buttonBox, QtCore.SIGNAL(_fromUtf8("rejected()")), MHTImportDialog.reject)
         QtCore.QMetaObject.connectSlotsByName(MHTImportDialog)
+        MHTImportDialog.setTabOrder(self.tablesList, self.buttonBox)
 
     def retranslateUi(self, MHTImportDialog):
         MHTImportDialog.setWindowTitle(_translate("MHTImportDialog", "Import", None))
         self.groupBox.setTitle(_translate("MHTImportDialog", "Import options", None))
         self.label_2.setText(_translate("MHTImportDialog", "Deck", None))
+        self.tablesBox.setTitle(_translate("MHTImportDialog", "Tables", None))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+"""Notice exports that are saved or changed in a folder.
+
+`Watcher.poll` is cheap enough to be called from a timer on the GUI thread:
+it never blocks and never lists the folder when nothing happened in it. On
+Linux the kernel reports changes through inotify. Elsewhere the folder is
+only listed again when its mtime changes, and otherwise just the exports
+already in it are stat'ed, to notice them being overwritten.
+"""
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import os
+import struct
+import sys
+import time
+
+# inotify events, see inotify(7).
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_EVENTS = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+           IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# Header of an inotify event: watch, mask, cookie and length of the name.
+_HEADER = struct.Struct('iIII')
+
+# Bytes of events read at a time.
+READ_SIZE = 64 * 1024
+
+
+class Watcher(object):
+    """Reports the exports in `directory` that changed since they were last
+    processed, once they have stopped changing.
+
+    A file counts as changed when its size or mtime differ from what was
+    recorded by `processed`. `known` maps paths to these signatures and is
+    updated in place, so it can be saved and passed in again next time.
+    Files that are still being written are held back until their size and
+    mtime have stayed the same for `settle` seconds.
+    """
+
+    def __init__(self, directory, patterns=('*.mht',), settle=5.0,
+                 known=None):
+        self.directory = os.path.abspath(directory)
+        self.patterns = patterns
+        self.settle = settle
+        self.known = {} if known is None else known
+        # Files that changed, with their signature and since when it is the
+        # same, until they have settled.
+        self.pending = {}
+        # Signatures of settled files until they are processed.
+        self.ready = {}
+        self._notify = _Inotify.open(self.directory)
+        # For polling: the folder's mtime when it was last listed and the
+        # signatures of the exports seen in it.
+        self._mtime = None
+        self._files = {}
+        self._changed(self._list() if self._notify else self._poll_folder())
+
+    @property
+    def uses_inotify(self):
+        return self._notify is not None
+
+    def poll(self, now=None):
+        """Return the paths of the files that are ready to be processed."""
+        now = time.time() if now is None else now
+        if self._notify is not None:
+            try:
+                paths = self._notify.read(self._matches)
+            except _Overflow:
+                paths = self._list()
+            except _Gone:
+                self._notify.close()
+                self._notify = None
+                paths = self._poll_folder()
+        else:
+            paths = self._poll_folder()
+        self._changed(paths, now)
+
+        ready = []
+        for path, (signature, since) in self.pending.items():
+            current = _signature(path)
+            if current is None:
+                del self.pending[path]
+            elif current != signature:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self.pending[path]
+                self.ready[path] = signature
+                ready.append(path)
+        return sorted(ready)
+
+    def processed(self, path):
+        """Record that the file at `path`, as `poll` reported it, was
+        processed, so it is only reported again once it changes."""
+        signature = self.ready.pop(path, None)
+        if signature is not None:
+            self.known[path] = signature
+
+    def close(self):
+        if self._notify is not None:
+            self._notify.close()
+            self._notify = None
+
+    def _changed(self, paths, now=None):
+        now = time.time() if now is None else now
+        for path in paths:
+            signature = _signature(path)
+            if signature is None or signature == self.known.get(path):
+                self.pending.pop(path, None)
+            elif path not in self.pending or \
+                    self.pending[path][0] != signature:
+                self.pending[path] = (signature, now)
+
+    def _list(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name)
+                for name in names if self._matches(name)]
+
+    def _poll_folder(self):
+        # Files are only added or removed when the folder's mtime changes,
+        # but may be overwritten without that, so the known ones are
+        # stat'ed every time.
+        try:
+            mtime = os.stat(self.directory).st_mtime
+        except OSError:
+            return []
+        if mtime != self._mtime:
+            self._mtime = mtime
+            listed = self._list()
+            self._files = dict((path, self._files.get(path))
+                               for path in listed)
+        changed = []
+        for path, signature in self._files.items():
+            current = _signature(path)
+            if current != signature:
+                self._files[path] = current
+                changed.append(path)
+        return changed
+
+    def _matches(self, name):
+        name = name.lower()
+        return any(fnmatch.fnmatch(name, pattern)
+                   for pattern in self.patterns)
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime)
+
+
+class _Overflow(Exception):
+    # Events were lost, so the whole folder must be looked at.
+    pass
+
+
+class _Gone(Exception):
+    # The folder was removed or moved away.
+    pass
+
+
+class _Inotify(object):
+    """A non-blocking inotify watch of a single folder, through ctypes."""
+
+    _libc = None
+
+    @classmethod
+    def open(cls, directory):
+        """Return a watch of `directory`, or `None` if inotify is not
+        available."""
+        try:
+            if cls._libc is None:
+                cls._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                        use_errno=True)
+            libc = cls._libc
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (AttributeError, OSError, TypeError):
+            # Not Linux, or no C library to be found.
+            return None
+        if fd < 0:
+            return None
+        path = directory
+        if isinstance(path, unicode):
+            path = path.encode(sys.getfilesystemencoding() or 'utf-8')
+        if libc.inotify_add_watch(fd, path, _EVENTS) < 0:
+            os.close(fd)
+            return None
+        return cls(fd, directory)
+
+    def __init__(self, fd, directory):
+        self.fd = fd
+        self.directory = directory
+
+    def read(self, matches):
+        """Return the paths of matching files that had events since the
+        last call."""
+        paths = set()
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except OSError as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _HEADER.unpack_from(data, offset)
+                offset += _HEADER.size
+                name = data[offset:offset + length].rstrip('\0')
+                offset += length
+                if isinstance(self.directory, unicode):
+                    name = name.decode(
+                        sys.getfilesystemencoding() or 'utf-8', 'replace')
+                if mask & IN_Q_OVERFLOW:
+                    raise _Overflow()
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    raise _Gone()
+                if name and matches(name):
+                    paths.add(os.path.join(self.directory, name))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Tests of the html backends.
+
+Run with `python -m unittest discover tests` from the repository.
+"""
+import os
+import sys
+import unittest
+
+# The add-on's modules import each other by their short names.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'onenote_importer'))
+
+import backends
+
+# OneNote's OCR text of an image: non-ASCII text and an entity together.
+PAGE = ('<table><tr><td><img alt="Machine generated alternative text:&#10;'
+        'Café • menu &amp; more" src="image.png"></td><td>back</td></tr>'
+        '</table>')
+
+
+class HTMLParserBackendTest(unittest.TestCase):
+
+    def test_attribute_with_entity_and_non_ascii_text(self):
+        document = backends.HTMLParserBackend(PAGE)
+        img = document.images()[0]
+        self.assertEqual(document.get(img, 'alt'),
+                         'Machine generated alternative text:\n'
+                         'Café • menu & more')
+        row = document.rows(document.tables()[0])[0]
+        question, answer = [document.render(cell)
+                            for cell in document.cells(row)]
+        self.assertIsInstance(question, str)
+        self.assertIn('Café • menu &amp; more', question)
+        self.assertEqual(answer, 'back')
+
+
+if __name__ == '__main__':
+    unittest.main()
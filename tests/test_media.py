@@ -0,0 +1,90 @@
+"""Tests of staging media and moving it into the media folder.
+
+Run with `python -m unittest discover tests` from the repository.
+"""
+import hashlib
+import os
+import shutil
+import sys
+import unittest
+from tempfile import mkdtemp
+
+# The add-on's modules import each other by their short names.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'onenote_importer'))
+
+import media
+
+
+class Stop(Exception):
+    pass
+
+
+class CommitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.media_dir = os.path.join(self.directory, 'collection.media')
+        self.temp_dir = os.path.join(self.directory, 'staging')
+        os.mkdir(self.media_dir)
+        os.mkdir(self.temp_dir)
+        with open(os.path.join(self.media_dir, 'old.png'), 'wb') as file_:
+            file_.write('old')
+        self.file_map = {}
+        for number in range(5):
+            data = 'image %d' % number
+            filename, path = media.store(
+                lambda file_: file_.write(data), 'image.png',
+                temp_dir=self.temp_dir)
+            self.file_map['image%d.png' % number] = {
+                'filename': filename, 'path': path}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_media_is_named_after_its_content(self):
+        media.commit(self.file_map, self.media_dir)
+        self.assertEqual(len(os.listdir(self.media_dir)), 6)
+        for meta in self.file_map.values():
+            self.assertIsNone(meta['path'])
+            with open(os.path.join(self.media_dir, meta['filename'])) as file_:
+                self.assertEqual(
+                    media.content_filename(
+                        hashlib.sha1(file_.read()).hexdigest(),
+                        'image.png'),
+                    meta['filename'])
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def assertRolledBack(self):
+        self.assertEqual(os.listdir(self.media_dir), ['old.png'])
+        self.assertEqual(os.listdir(self.temp_dir), [])
+        for meta in self.file_map.values():
+            self.assertIsNone(meta['path'])
+
+    def test_failed_rename_leaves_the_media_folder_unchanged(self):
+        def progress(done):
+            if done == 3:
+                raise Stop()
+
+        self.assertRaises(Stop, media.commit, self.file_map, self.media_dir,
+                          progress)
+        self.assertRolledBack()
+
+    def test_failed_copy_leaves_the_media_folder_unchanged(self):
+        # As if the staged files were on another file system.
+        rename = media._rename
+        media._rename = lambda source, target: False
+        try:
+            def progress(done):
+                if done == 3:
+                    raise Stop()
+
+            self.assertRaises(Stop, media.commit, self.file_map,
+                              self.media_dir, progress, threads=2)
+        finally:
+            media._rename = rename
+        self.assertRolledBack()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+"""Tests of reading .mht exports part by part and through their index.
+
+Run with `python -m unittest discover tests` from the repository.
+"""
+import email
+import os
+import quopri
+import random
+import shutil
+import sys
+import time
+import unittest
+from cStringIO import StringIO
+from tempfile import mkdtemp
+
+# The add-on's modules import each other by their short names.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'onenote_importer'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'benchmarks'))
+
+import generate
+import mht
+from emaildata.text import decoder_for
+
+
+def _decoded_parts(parts):
+    decoded = []
+    for part in parts:
+        body = StringIO()
+        part.copy_to(body)
+        decoded.append((part.location, part.content_type, body.getvalue()))
+    return decoded
+
+
+class PartsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def export(self, **options):
+        path = os.path.join(self.directory, 'export.mht')
+        with open(path, 'wb') as file_:
+            generate.generate(file_, rows=50, images=3, image_size=5000,
+                              **options)
+        return path
+
+    def expected(self, path):
+        with open(path, 'rb') as file_:
+            message = email.message_from_file(file_)
+        return [(part.get('Content-Location'), part.get_content_type(),
+                 part.get_payload(decode=True))
+                for part in message.get_payload()]
+
+    def test_parts_and_indexed_parts_match_the_email_package(self):
+        for encoding in ('quoted-printable', 'base64'):
+            path = self.export(encoding=encoding)
+            expected = self.expected(path)
+
+            index = []
+            with open(path, 'rb') as file_:
+                self.assertEqual(
+                    _decoded_parts(mht.iter_parts(file_, index)), expected)
+            self.assertEqual(
+                _decoded_parts(mht.indexed_parts(path, index)), expected)
+
+    def test_index_holds_the_byte_range_of_every_body(self):
+        path = self.export()
+        index = []
+        with open(path, 'rb') as file_:
+            for part in mht.iter_parts(file_, index):
+                pass
+        with open(path, 'rb') as file_:
+            data = file_.read()
+        for entry in index:
+            # The body ends right before the line break of the delimiter.
+            self.assertTrue(data[entry['end']:].startswith(
+                '\r\n--' + generate.BOUNDARY))
+            self.assertEqual(data[entry['start'] - 4:entry['start']],
+                             '\r\n\r\n')
+
+    def test_parts_left_unread_are_skipped(self):
+        path = self.export()
+        expected = self.expected(path)
+        with open(path, 'rb') as file_:
+            parts = mht.iter_parts(file_)
+            next(parts)
+            self.assertEqual(_decoded_parts(parts), expected[1:])
+
+    def test_index_is_saved_loaded_and_invalidated(self):
+        path = self.export()
+        index_dir = os.path.join(self.directory, 'index')
+        index = []
+        with open(path, 'rb') as file_:
+            for part in mht.iter_parts(file_, index):
+                pass
+        self.assertIsNone(mht.load_index(path, index_dir))
+        mht.save_index(path, index_dir, index)
+        self.assertEqual(mht.load_index(path, index_dir), index)
+
+        with open(path, 'ab') as file_:
+            file_.write('\r\n')
+        self.assertIsNone(mht.load_index(path, index_dir))
+
+    def test_indexes_used_longest_ago_are_removed(self):
+        index_dir = os.path.join(self.directory, 'index')
+        paths = []
+        for number in range(4):
+            path = os.path.join(self.directory, '%d.mht' % number)
+            with open(path, 'wb') as file_:
+                file_.write('page %d' % number)
+            paths.append(path)
+        now = time.time()
+        for number, path in enumerate(paths[:3]):
+            mht.save_index(path, index_dir, [], max_files=3)
+            os.utime(mht._index_path(path, index_dir),
+                     (now - 100 + number, now - 100 + number))
+        # Using the first one makes the second the one used longest ago.
+        mht.load_index(paths[0], index_dir)
+        mht.save_index(paths[3], index_dir, [], max_files=3)
+
+        self.assertEqual(len(os.listdir(index_dir)), 3)
+        self.assertIsNone(mht.load_index(paths[1], index_dir))
+        for path in (paths[0], paths[2], paths[3]):
+            self.assertEqual(mht.load_index(path, index_dir), [])
+
+
+class DecoderTest(unittest.TestCase):
+
+    def decode(self, encoding, encoded, rand):
+        # Fed in pieces of random sizes, like lines and mapped chunks.
+        decoder = decoder_for(encoding)
+        decoded = []
+        position = 0
+        while position < len(encoded):
+            size = rand.randint(1, 100)
+            decoded.append(decoder.feed(encoded[position:position + size]))
+            position += size
+        decoded.append(decoder.flush())
+        return ''.join(decoded)
+
+    def test_pieces_decode_like_the_whole(self):
+        rand = random.Random(0)
+        data = ''.join(chr(rand.randint(0, 255)) for _ in range(5000))
+        text = generate.cell(rand, 5000)
+        for _ in range(20):
+            self.assertEqual(self.decode(
+                'base64', generate.encode_base64(data), rand), data)
+            self.assertEqual(self.decode(
+                'quoted-printable',
+                quopri.encodestring(text).replace('\n', '\r\n'), rand),
+                text)
+            self.assertEqual(self.decode('8bit', text, rand), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Tests of the parser and the census of the import dialog.
+
+Run with `python -m unittest discover tests` from the repository.
+"""
+import os
+import shutil
+import sys
+import unittest
+from tempfile import mkdtemp
+
+# The add-on's modules import each other by their short names.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'onenote_importer'))
+
+import backends
+import census
+from parser import Parser
+
+EXPORT = ('MIME-Version: 1.0\r\n'
+          'Content-Type: multipart/related; boundary="BOUNDARY"\r\n'
+          '\r\n'
+          '--BOUNDARY\r\n'
+          'Content-Location: file:///C:/page.htm\r\n'
+          'Content-Transfer-Encoding: 8bit\r\n'
+          'Content-Type: text/html; charset="utf-8"\r\n'
+          '\r\n'
+          '%s\r\n'
+          '--BOUNDARY--\r\n')
+
+# A heading spanning both columns, above a row of a front and a back side.
+HEADING = ('<html><body><table>'
+           '<tr><td colspan=2>Heading</td></tr>'
+           '<tr><td>front</td><td>back</td></tr>'
+           '</table></body></html>')
+
+
+class ShortRowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, 'page.mht')
+        with open(self.path, 'wb') as file_:
+            file_.write(EXPORT % HEADING)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rows_with_a_single_cell_are_skipped(self):
+        for backend in backends.BACKENDS:
+            for streaming in (False, True):
+                parser = Parser(self.path, streaming=streaming,
+                                backend=backend)
+                self.assertEqual(parser.rows(), [('front', 'back')])
+                self.assertEqual(parser.stats.counters['rows'], 1)
+                self.assertEqual(parser.stats.counters['rows_skipped'], 1)
+
+    def test_census_counts_the_rows_that_are_imported(self):
+        for backend in backends.BACKENDS:
+            table, = census.scan(self.path, backend)
+            self.assertEqual((table.rows, table.columns, table.cards),
+                             (2, 2, 1))
+            self.assertTrue(table.importable)
+
+
+if __name__ == '__main__':
+    unittest.main()
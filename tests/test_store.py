@@ -0,0 +1,60 @@
+"""Tests of the store of imported rows.
+
+Run with `python -m unittest discover tests` from the repository.
+"""
+import os
+import shutil
+import sys
+import unittest
+from tempfile import mkdtemp
+
+# The add-on's modules import each other by their short names.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'onenote_importer'))
+
+from store import RowStore
+
+
+class RowStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, 'rows.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_only_new_and_changed_rows_are_imported_again(self):
+        store = RowStore(self.path)
+        self.assertEqual(list(store.filter('a.mht', [('q1', 'a1'),
+                                                     ('q2', 'a2')])),
+                         [('q1', 'a1'), ('q2', 'a2')])
+        store.commit()
+        store.close()
+
+        store = RowStore(self.path)
+        rows = [('q1', 'a1'), ('q2', 'edited'), ('q3', 'a3')]
+        self.assertEqual(store.check('a.mht', *rows[0]), RowStore.UNCHANGED)
+        self.assertEqual(store.check('a.mht', *rows[1]), RowStore.CHANGED)
+        self.assertEqual(store.check('a.mht', *rows[2]), RowStore.NEW)
+        # Rows of another file are told apart.
+        self.assertEqual(store.check('b.mht', *rows[0]), RowStore.NEW)
+        store.close()
+
+    def test_rows_are_forgotten_unless_committed(self):
+        store = RowStore(self.path)
+        list(store.filter('a.mht', [('q1', 'a1')]))
+        store.close()
+
+        store = RowStore(self.path)
+        self.assertEqual(list(store.filter('a.mht', [('q1', 'a1')])),
+                         [('q1', 'a1')])
+        self.assertEqual(store.skipped, 0)
+        store.commit()
+        self.assertEqual(list(store.filter('a.mht', [('q1', 'a1')])), [])
+        self.assertEqual(store.skipped, 1)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()